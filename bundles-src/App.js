@@ -62,6 +62,18 @@ class App extends Component {
 
     let csrfToken = document.querySelector("[name=csrfmiddlewaretoken]").value;
 
+    // Повторная отправка того же заказа идёт с тем же ключом, и сервер не
+    // создаст второй заказ, если первый ответ потерялся по дороге.
+    let body = JSON.stringify(data);
+    if (!this.checkoutAttempt || this.checkoutAttempt.body !== body){
+      this.checkoutAttempt = {
+        body,
+        idempotencyKey: window.crypto && window.crypto.randomUUID
+          ? window.crypto.randomUUID()
+          : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`,
+      };
+    }
+
     try {
       let response = await fetch(url, {
         method: 'post',
@@ -69,8 +81,9 @@ class App extends Component {
           'Accept': 'application/json',
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken,
+          'Idempotency-Key': this.checkoutAttempt.idempotencyKey,
         },
-        body: JSON.stringify(data),
+        body,
       });
 
       if (!response.ok){
@@ -79,6 +92,7 @@ class App extends Component {
       }
       let responseData = await response.json();
 
+      this.checkoutAttempt = null;
       this.setState({
         cart: [],
       });
@@ -102,7 +116,18 @@ class App extends Component {
 
 
   async getProducts(){
-    let response = await fetch('/api/products/', {
+    let catalog = null;
+    try {
+      catalog = JSON.parse(localStorage.getItem('catalog'));
+    } catch(error){
+      catalog = null;
+    }
+
+    let url = '/api/products/';
+    if (catalog && catalog.token){
+      url = `/api/products/?since=${catalog.token}`;
+    }
+    let response = await fetch(url, {
       headers: {
         'Accept': 'application/json',
         'Content-Type': 'application/json',
@@ -114,8 +139,21 @@ class App extends Component {
     }
 
     let data = await response.json();
+    let products = data;
+    let token = response.headers.get('X-Catalog-Token');
+    if (!Array.isArray(data)){
+      token = data.token;
+      products = data.full ? data.products : _.unionBy(data.products, catalog.products, 'id');
+      products = products.filter(product => !data.removed.includes(product.id));
+    }
+
+    try {
+      localStorage.setItem('catalog', JSON.stringify({token, products}));
+    } catch(error){
+      // Каталог просто скачается целиком при следующем открытии страницы
+    }
     this.setState({
-      products : data
+      products : products
     });
   }
 
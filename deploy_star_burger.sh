@@ -19,6 +19,7 @@ npm ci
 
 ./venv/bin/python3.10 manage.py collectstatic --noinput
 ./venv/bin/python3.10 manage.py migrate --noinput
+./venv/bin/python3.10 manage.py update_order_candidates
 
 systemctl restart star-burger-django.service
 systemctl reload nginx
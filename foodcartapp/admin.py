@@ -1,19 +1,21 @@
 from django.contrib import admin
+from django.db import transaction
 from django.shortcuts import reverse, redirect, get_object_or_404
 
 from django.templatetags.static import static
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 
+from .models import DeliveryZone
 from .models import Product
 from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
 from .models import Order
 from .models import OrderItem
+from .availability import update_orders_candidates
 from .serializers import RestaurantSerializer
-from .utils import fetch_coordinates
-from locations.models import Location
+from .utils import get_or_fetch_location
 import star_burger.settings as settings
 
 
@@ -22,6 +24,11 @@ class RestaurantMenuItemInline(admin.TabularInline):
     extra = 0
 
 
+class DeliveryZoneInline(admin.TabularInline):
+    model = DeliveryZone
+    extra = 0
+
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 1
@@ -38,24 +45,19 @@ class RestaurantAdmin(admin.ModelAdmin):
         'name',
         'address',
         'contact_phone',
+        'capacity',
+        'kitchen_load',
+        'delivery_load',
     ]
     inlines = [
-        RestaurantMenuItemInline
+        RestaurantMenuItemInline,
+        DeliveryZoneInline,
     ]
 
     def save_model(self, request, obj, form, change):
         serializer = RestaurantSerializer(data=request.POST)
         if serializer.is_valid(raise_exception=True):
-            try:
-                location = Location.objects.get(address=obj.address)
-            except Location.DoesNotExist:
-                lon, lat = fetch_coordinates(obj.address)
-                location = Location.objects.create(
-                    lat=lat,
-                    lon=lon,
-                    address=obj.address
-                )
-            obj.coordinates = location
+            obj.coordinates = get_or_fetch_location(obj.address)
             super().save_model(request, obj, form, change)
 
 
@@ -163,6 +165,9 @@ class OrderAdmin(admin.ModelAdmin):
                 'called_at',
                 'delivered_at',
                 'address',
+                'geocoding_status',
+                'in_delivery_zone',
+                'delivery_restaurants',
                 'firstname',
                 'lastname',
                 'phonenumber',
@@ -172,6 +177,9 @@ class OrderAdmin(admin.ModelAdmin):
     readonly_fields = [
         'cost',
         'registered_at',
+        'geocoding_status',
+        'in_delivery_zone',
+        'delivery_restaurants',
     ]
     list_editable = [
         'status',
@@ -179,6 +187,17 @@ class OrderAdmin(admin.ModelAdmin):
         'restaurant',
     ]
 
+    def save_model(self, request, obj, form, change):
+        if 'address' in form.changed_data:
+            obj.location = None
+            obj.geocoding_status = Order.PENDING
+            obj.in_delivery_zone = None
+        super().save_model(request, obj, form, change)
+        if obj.geocoding_status == Order.PENDING:
+            transaction.on_commit(
+                Order.objects.filter(pk=obj.pk).geocode_in_background
+            )
+
     def save_formset(self, request, form, formset, change):
         instances = formset.save(commit=False)
         for instance in instances:
@@ -186,13 +205,12 @@ class OrderAdmin(admin.ModelAdmin):
             instance.save()
         formset.save_m2m()
         super().save_formset(request, form, formset, change)
-
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.fetch_with_cost()
+        if formset.model is OrderItem:
+            form.instance.update_total()
+            update_orders_candidates([form.instance])
 
     def cost(self, obj):
-        return f'{obj.cost} руб.'
+        return f'{obj.total} руб.'
     cost.short_description = 'Стоимость'
 
     def response_post_save_change(self, request, obj):
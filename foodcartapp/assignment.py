@@ -0,0 +1,129 @@
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+
+from .availability import get_orders_candidates
+from .models import Order, OrderChange, Restaurant
+
+
+def assign_orders(distances, capacities):
+    # Назначение минимальной суммарной длины доставки при ограничении на число
+    # заказов в ресторане — задача о потоке минимальной стоимости. Заказы
+    # добавляются по одному вдоль кратчайшего пути увеличения, как в венгерском
+    # алгоритме: путь может пересадить уже назначенные заказы в другие
+    # рестораны, чтобы освободить место. Граф пересадок строится только между
+    # ресторанами, поэтому шаг стоит O(заказов × ресторанов), а не растёт с
+    # квадратом числа заказов.
+    #
+    # distances — матрица заказ × ресторан, np.inf там, где ресторан не может
+    # выполнить заказ. Если мест не хватает на всех, места достаются заказам
+    # в порядке строк. Возвращает индекс ресторана для каждого заказа, -1 —
+    # не назначен.
+    distances = np.asarray(distances, dtype=float)
+    orders_count, restaurants_count = distances.shape
+    capacities = np.asarray(capacities)
+    loads = np.zeros(restaurants_count, dtype=int)
+    assignment = np.full(orders_count, -1)
+    restaurant_indices = np.arange(restaurants_count)
+
+    for order_index in range(orders_count):
+        nearest_index = int(np.argmin(distances[order_index]))
+        if not np.isfinite(distances[order_index, nearest_index]):
+            continue
+        if loads[nearest_index] < capacities[nearest_index]:
+            # Пересадки в ресторан со свободными местами не бывают выгодными,
+            # иначе назначение уже не было бы оптимальным, так что путь короче
+            # прямой доставки из ближайшего ресторана не найдётся.
+            loads[nearest_index] += 1
+            assignment[order_index] = nearest_index
+            continue
+
+        # transfer_costs[r, r2] — на сколько вырастет путь, если пересадить
+        # лучший из заказов ресторана r в ресторан r2.
+        transfer_costs = np.full((restaurants_count, restaurants_count), np.inf)
+        transfer_orders = np.full((restaurants_count, restaurants_count), -1)
+        for restaurant_index in np.flatnonzero(loads):
+            assigned = np.flatnonzero(assignment == restaurant_index)
+            costs = distances[assigned] - distances[assigned, restaurant_index][:, np.newaxis]
+            best = np.argmin(costs, axis=0)
+            transfer_costs[restaurant_index] = costs[best, restaurant_indices]
+            transfer_orders[restaurant_index] = assigned[best]
+
+        # Форд — Беллман по ресторанам: отрицательные стоимости пересадок
+        # допустимы, отрицательных циклов при оптимальном назначении нет.
+        path_costs = distances[order_index].copy()
+        previous = np.full(restaurants_count, -1)
+        for _ in range(restaurants_count):
+            costs = path_costs[:, np.newaxis] + transfer_costs
+            best = np.argmin(costs, axis=0)
+            best_costs = costs[best, restaurant_indices]
+            improved = best_costs < path_costs
+            if not improved.any():
+                break
+            path_costs[improved] = best_costs[improved]
+            previous[improved] = best[improved]
+
+        path_costs[loads >= capacities] = np.inf
+        restaurant_index = int(np.argmin(path_costs))
+        if not np.isfinite(path_costs[restaurant_index]):
+            continue
+
+        loads[restaurant_index] += 1
+        while previous[restaurant_index] != -1:
+            previous_index = previous[restaurant_index]
+            assignment[transfer_orders[previous_index, restaurant_index]] = restaurant_index
+            restaurant_index = previous_index
+        assignment[order_index] = restaurant_index
+    return assignment
+
+
+@transaction.atomic
+def assign_restaurants():
+    # Заказы, которые менеджер или другой процесс назначают в это же время,
+    # заблокированы и будут пропущены до следующего запуска.
+    orders = list(
+        Order.objects.filter(
+            status=Order.ACCEPTED,
+            restaurant__isnull=True,
+            location__lat__isnull=False,
+        ).select_related('location')
+         .select_for_update(skip_locked=True, of=('self',))
+         .order_by('registered_at', 'id')
+    )
+    orders_candidates = get_orders_candidates(orders)
+    restaurants = {
+        candidate.restaurant.id: candidate.restaurant
+        for candidates in orders_candidates.values()
+        for candidate in candidates
+        if candidate.distance is not None
+    }
+    if not restaurants:
+        return []
+
+    restaurant_ids = sorted(restaurants)
+    restaurant_indices = {
+        restaurant_id: index for index, restaurant_id in enumerate(restaurant_ids)
+    }
+    distances = np.full((len(orders), len(restaurant_ids)), np.inf)
+    for order_index, order in enumerate(orders):
+        for candidate in orders_candidates[order.id]:
+            if candidate.distance is not None:
+                distances[order_index, restaurant_indices[candidate.restaurant.id]] = candidate.distance
+    capacities = [
+        max(restaurants[restaurant_id].capacity - restaurants[restaurant_id].kitchen_load, 0)
+        for restaurant_id in restaurant_ids
+    ]
+
+    assignment = assign_orders(distances, capacities)
+    assigned_orders = []
+    for order, restaurant_index in zip(orders, assignment):
+        if restaurant_index != -1:
+            order.restaurant_id = restaurant_ids[restaurant_index]
+            assigned_orders.append(order)
+    Order.objects.bulk_update(assigned_orders, ['restaurant'])
+    OrderChange.objects.record(order.id for order in assigned_orders)
+    assigned_counts = Counter(order.restaurant_id for order in assigned_orders)
+    for restaurant_id, count in assigned_counts.items():
+        Restaurant.objects.filter(pk=restaurant_id).add_load(Order.ACCEPTED, count)
+    return assigned_orders
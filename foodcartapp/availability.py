@@ -0,0 +1,238 @@
+import time
+from collections import defaultdict, namedtuple
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Order, OrderCandidate, OrderChange, OrderItem, Restaurant, RestaurantMenuItem
+from .distances import get_locations_distances
+from .spatial import get_restaurant_index
+
+
+INDEX_TTL = 60
+
+RestaurantCandidate = namedtuple('RestaurantCandidate', ['restaurant', 'distance'])
+
+
+class AvailabilityIndex:
+    # Для каждого товара хранится битовая маска ресторанов, где он в продаже.
+    # Рестораны, способные приготовить весь заказ, — это AND масок его товаров.
+    def __init__(self):
+        self.restaurant_bits = {}
+        self.restaurant_ids = []
+        self.product_masks = {}
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        menu_items = RestaurantMenuItem.objects.filter(availability=True)\
+                                               .values_list('product_id', 'restaurant_id')
+        for product_id, restaurant_id in menu_items:
+            index.product_masks[product_id] = (
+                index.product_masks.get(product_id, 0)
+                | index.get_restaurant_flag(restaurant_id)
+            )
+        return index
+
+    def is_expired(self):
+        return time.monotonic() - self.built_at > INDEX_TTL
+
+    def get_restaurant_flag(self, restaurant_id):
+        if restaurant_id not in self.restaurant_bits:
+            self.restaurant_bits[restaurant_id] = len(self.restaurant_ids)
+            self.restaurant_ids.append(restaurant_id)
+        return 1 << self.restaurant_bits[restaurant_id]
+
+    def refresh_products(self, product_ids):
+        menu_items = RestaurantMenuItem.objects.filter(
+            product_id__in=product_ids,
+            availability=True
+        ).values_list('product_id', 'restaurant_id')
+        product_masks = dict.fromkeys(product_ids, 0)
+        for product_id, restaurant_id in menu_items:
+            product_masks[product_id] |= self.get_restaurant_flag(restaurant_id)
+        self.product_masks.update(product_masks)
+
+    def get_mask(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return 0
+        mask = -1
+        for product_id in product_ids:
+            mask &= self.product_masks.get(product_id, 0)
+        return mask
+
+    def get_restaurant_ids(self, product_ids):
+        mask = self.get_mask(product_ids)
+        restaurant_ids = []
+        while mask:
+            lowest_flag = mask & -mask
+            restaurant_ids.append(self.restaurant_ids[lowest_flag.bit_length() - 1])
+            mask ^= lowest_flag
+        return restaurant_ids
+
+
+availability_index = None
+availability_index_lock = Lock()
+
+
+def get_availability_index():
+    # Индекс живёт в памяти процесса: изменения меню в этом процессе применяются
+    # сразу через сигналы, из других процессов — после пересборки по INDEX_TTL.
+    global availability_index
+    with availability_index_lock:
+        if not availability_index or availability_index.is_expired():
+            availability_index = AvailabilityIndex.build()
+        return availability_index
+
+
+def refresh_availability(product_ids):
+    with availability_index_lock:
+        if availability_index:
+            availability_index.refresh_products(product_ids)
+
+
+def reset_availability_index():
+    global availability_index
+    with availability_index_lock:
+        availability_index = None
+
+
+def get_orders_candidates(orders):
+    # Число запросов не зависит от количества заказов: заказы (локации нужно
+    # подгрузить через select_related), товары заказов, рестораны и, если
+    # индексы устарели, их пересборка.
+    orders = list(orders)
+    orders_products_ids = defaultdict(list)
+    order_items = OrderItem.objects.filter(order_id__in=[order.id for order in orders])\
+                                   .values_list('order_id', 'product_id')
+    for order_id, product_id in order_items:
+        orders_products_ids[order_id].append(product_id)
+
+    restaurants = {
+        restaurant.id: restaurant
+        for restaurant in Restaurant.objects.select_related('coordinates')
+    }
+    availability_index = get_availability_index()
+    orders_restaurant_ids = {
+        order.id: availability_index.get_restaurant_ids(orders_products_ids[order.id])
+        for order in orders
+    }
+    located_restaurants = {
+        restaurant.id: restaurant
+        for restaurant in restaurants.values()
+        if restaurant.coordinates and restaurant.coordinates.is_found()
+    }
+    # У заказа с координатами в кандидаты попадают только ближайшие из
+    # ресторанов с координатами — их находит k-d дерево, а не перебор.
+    # Рестораны без координат остаются в списке без расстояния.
+    restaurant_index = get_restaurant_index()
+    for order in orders:
+        if not order.location or not order.location.is_found():
+            continue
+        restaurant_ids = set(orders_restaurant_ids[order.id])
+        nearest_restaurant_ids = {
+            restaurant_id
+            for restaurant_id, _ in restaurant_index.nearest(
+                order.location.get_coordinates(),
+                settings.ORDER_CANDIDATES_COUNT,
+                restaurant_ids & located_restaurants.keys()
+            )
+        }
+        orders_restaurant_ids[order.id] = [
+            restaurant_id for restaurant_id in restaurant_ids
+            if restaurant_id in nearest_restaurant_ids or restaurant_id not in located_restaurants
+        ]
+    distances = get_locations_distances(
+        (order.location, located_restaurants[restaurant_id].coordinates)
+        for order in orders if order.location
+        for restaurant_id in orders_restaurant_ids[order.id]
+        if restaurant_id in located_restaurants
+    )
+
+    orders_candidates = {}
+    for order in orders:
+        candidates = []
+        for restaurant_id in orders_restaurant_ids[order.id]:
+            if restaurant_id not in restaurants:
+                continue
+            restaurant = restaurants[restaurant_id]
+            distance = None
+            if order.location and restaurant.coordinates:
+                distance = distances.get((order.location_id, restaurant.coordinates_id))
+            candidates.append(RestaurantCandidate(restaurant, distance))
+        orders_candidates[order.id] = sorted(candidates, key=get_candidate_score)
+    return orders_candidates
+
+
+def get_candidate_score(candidate):
+    # Полностью загруженная кухня равноценна лишним RESTAURANT_LOAD_WEIGHT км
+    # пути: заказ уйдёт в ресторан чуть дальше, но приготовят его быстрее.
+    if candidate.distance is None:
+        return (True, candidate.restaurant.get_load_ratio())
+    load_penalty = settings.RESTAURANT_LOAD_WEIGHT * candidate.restaurant.get_load_ratio()
+    return (False, candidate.distance + load_penalty)
+
+
+@transaction.atomic
+def update_orders_candidates(orders):
+    # Кандидатов одного заказа могут пересчитывать одновременно фоновое
+    # геокодирование и правка меню. Блокировка заказов, в порядке id, чтобы
+    # не было взаимных блокировок, не даёт им вставить кандидатов дважды.
+    orders = list(orders)
+    list(
+        Order.objects.select_for_update()
+                     .filter(id__in=[order.id for order in orders])
+                     .order_by('id')
+                     .values_list('id', flat=True)
+    )
+    orders_candidates = get_orders_candidates(orders)
+    OrderCandidate.objects.filter(order_id__in=[order.id for order in orders]).delete()
+    OrderCandidate.objects.bulk_create([
+        OrderCandidate(
+            order_id=order_id,
+            restaurant=candidate.restaurant,
+            distance=candidate.distance,
+        )
+        for order_id, candidates in orders_candidates.items()
+        for candidate in candidates
+    ])
+    return orders_candidates
+
+
+def update_products_orders_candidates(product_ids):
+    # Пересчитываются только открытые заказы с изменившимися товарами.
+    orders = Order.objects.filter(
+        status__in=Order.ACTIVE_STATUSES,
+        order_items__product_id__in=product_ids,
+    ).select_related('location').distinct()
+    orders_candidates = update_orders_candidates(orders)
+    OrderChange.objects.record(orders_candidates)
+    return orders_candidates
+
+
+def update_restaurants_orders_candidates(restaurants):
+    # Ресторан передвинули: он мог войти в число ближайших или выйти из него
+    # у любого заказа с товарами из его меню.
+    product_ids = set(
+        RestaurantMenuItem.objects.filter(restaurant__in=restaurants)
+                                  .values_list('product_id', flat=True)
+    )
+    return update_products_orders_candidates(product_ids)
+
+
+def get_stored_orders_candidates(orders):
+    # Для страницы менеджера: один запрос к сохранённым кандидатам, порядок
+    # зависит от текущей загрузки ресторанов.
+    orders_candidates = {order.id: [] for order in orders}
+    stored_candidates = OrderCandidate.objects.filter(order_id__in=orders_candidates)\
+                                              .select_related('restaurant')
+    for stored_candidate in stored_candidates:
+        orders_candidates[stored_candidate.order_id].append(
+            RestaurantCandidate(stored_candidate.restaurant, stored_candidate.distance)
+        )
+    for candidates in orders_candidates.values():
+        candidates.sort(key=get_candidate_score)
+    return orders_candidates
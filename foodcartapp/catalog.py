@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+import json
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import CatalogChange, Product, RestaurantMenuItem
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_KEY = 'catalog:{version}'
+
+PRETTY = 'pretty'
+COMPACT = 'compact'
+JSON_DUMPS_PARAMS = {
+    PRETTY: {'indent': 4},
+    COMPACT: {'separators': (',', ':')},
+}
+
+loaded_catalog = None
+
+
+@lru_cache(maxsize=4096)
+def get_image_url(name):
+    # Адрес картинки зависит только от имени файла, поэтому хранилище
+    # спрашивается один раз на картинку, а не при каждой сборке каталога.
+    return default_storage.url(name)
+
+
+def get_products_restaurants(product_ids):
+    products_restaurants = defaultdict(list)
+    menu_items = RestaurantMenuItem.objects.filter(
+        product_id__in=product_ids,
+        availability=True
+    ).order_by('restaurant__name', 'restaurant_id')\
+     .values_list('product_id', 'restaurant_id', 'restaurant__name')
+    for product_id, restaurant_id, restaurant_name in menu_items:
+        products_restaurants[product_id].append({
+            'id': restaurant_id,
+            'name': restaurant_name,
+        })
+    return products_restaurants
+
+
+def serialize_product(product, restaurants):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': get_image_url(product.image.name),
+        'restaurants': restaurants,
+    }
+
+
+def serialize_products(products):
+    products = list(products)
+    products_restaurants = get_products_restaurants([product.id for product in products])
+    return [
+        serialize_product(product, products_restaurants[product.id])
+        for product in products
+    ]
+
+
+def build_catalog(version):
+    # Токен читается до товаров: изменения, внесённые во время сборки,
+    # клиент получит повторно при следующей синхронизации.
+    # Last-Modified — время последнего изменения каталога, а не версии кэша:
+    # версия меняется и тогда, когда кэш просто истёк.
+    token, last_modified = CatalogChange.objects.get_latest()
+    products = Product.objects.select_related('category').available()
+    dumped_products = serialize_products(products)
+
+    catalog = {
+        'version': version,
+        'token': token,
+        'last_modified': last_modified,
+        'products': dumped_products,
+        'variants': {},
+    }
+    for variant, json_dumps_params in JSON_DUMPS_PARAMS.items():
+        content = json.dumps(
+            dumped_products,
+            cls=DjangoJSONEncoder,
+            ensure_ascii=False,
+            **json_dumps_params
+        ).encode()
+        etag = hashlib.sha256(content).hexdigest()[:32]
+        catalog['variants'][variant] = {
+            'content': content,
+            'etag': f'{etag}-{variant}',
+            'gzip_content': gzip.compress(content, mtime=0),
+            'gzip_etag': f'{etag}-{variant}-gzip',
+        }
+    return catalog
+
+
+def get_catalog_version():
+    # Версия — время последнего изменения каталога в наносекундах. Кэш каталога
+    # хранится под ключом с версией, поэтому каталог, собранный во время
+    # изменения меню, попадёт под устаревший ключ и не будет отдан клиентам.
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), settings.CATALOG_CACHE_TIMEOUT)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def get_catalog():
+    # Готовый каталог текущей версии держится в памяти процесса: запрос
+    # стоит одного чтения версии из кэша, без распаковки каталога.
+    global loaded_catalog
+    version = get_catalog_version()
+    catalog = loaded_catalog
+    if catalog and catalog['version'] == version:
+        return catalog
+
+    catalog_key = CATALOG_KEY.format(version=version)
+    catalog = cache.get(catalog_key)
+    if catalog is None:
+        catalog = build_catalog(version)
+        cache.set(catalog_key, catalog, settings.CATALOG_CACHE_TIMEOUT)
+    loaded_catalog = catalog
+    return catalog
+
+
+def invalidate_catalog():
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), settings.CATALOG_CACHE_TIMEOUT)
+
+
+def get_catalog_changes(since):
+    # Токен — id последнего изменения каталога, которое видел клиент. Токены
+    # из будущего, нулевой токен и токен старше журнала изменений требуют
+    # полной синхронизации.
+    latest_token = CatalogChange.objects.get_latest_token()
+    if not 0 < since <= latest_token or CatalogChange.objects.is_purged_after(since):
+        catalog = get_catalog()
+        return {
+            'token': catalog['token'],
+            'full': True,
+            'products': catalog['products'],
+            'removed': [],
+        }
+
+    changed_product_ids = set(
+        CatalogChange.objects.after(since)
+                             .filter(id__lte=latest_token)
+                             .values_list('product_id', flat=True)
+    )
+    products = Product.objects.select_related('category')\
+                              .available()\
+                              .filter(id__in=changed_product_ids)
+    dumped_products = serialize_products(products)
+    available_product_ids = {product['id'] for product in dumped_products}
+    return {
+        'token': latest_token,
+        'full': False,
+        'products': dumped_products,
+        'removed': sorted(changed_product_ids - available_product_ids),
+    }
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+from django.conf import settings
+
+from locations.models import LocationDistance
+from .utils import get_pairwise_distances
+
+
+class DistanceCache:
+    # LRU-кэш расстояний между локациями. Вместе с расстоянием хранятся
+    # координаты, по которым оно посчитано: если локацию передвинули,
+    # запись считается устаревшей, в каком бы процессе это ни произошло.
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, coordinates):
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry or entry[0] != coordinates:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, coordinates, distance):
+        with self.lock:
+            self.entries[key] = (coordinates, distance)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+distance_cache = DistanceCache(settings.DISTANCE_CACHE_SIZE)
+
+
+def get_cache_key(origin, destination):
+    if origin.id > destination.id:
+        origin, destination = destination, origin
+    key = (origin.id, destination.id)
+    return key, (*origin.get_coordinates(), *destination.get_coordinates())
+
+
+def get_locations_distances(location_pairs):
+    # Принимает пары локаций с координатами, возвращает словарь
+    # {(id откуда, id куда): расстояние в км}.
+    requested_keys = {}
+    distances = {}
+    missing_coordinates = {}
+    for origin, destination in location_pairs:
+        key, coordinates = get_cache_key(origin, destination)
+        requested_keys[(origin.id, destination.id)] = key
+        if key in distances or key in missing_coordinates:
+            continue
+        distance = distance_cache.get(key, coordinates)
+        if distance is None:
+            missing_coordinates[key] = coordinates
+        else:
+            distances[key] = distance
+
+    if missing_coordinates and settings.DISTANCE_CACHE_PERSISTENT:
+        origin_ids, destination_ids = zip(*missing_coordinates)
+        stored_distances = LocationDistance.objects.filter(
+            origin_id__in=set(origin_ids),
+            destination_id__in=set(destination_ids)
+        ).values_list('origin_id', 'destination_id', 'distance')
+        for origin_id, destination_id, distance in stored_distances:
+            key = (origin_id, destination_id)
+            if key not in missing_coordinates:
+                continue
+            distance_cache.set(key, missing_coordinates.pop(key), distance)
+            distances[key] = distance
+
+    if missing_coordinates:
+        coordinates = np.array(list(missing_coordinates.values()), dtype=float)
+        calculated_distances = get_pairwise_distances(coordinates[:, :2], coordinates[:, 2:])
+        for key, distance in zip(missing_coordinates, calculated_distances.tolist()):
+            distance_cache.set(key, missing_coordinates[key], distance)
+            distances[key] = distance
+        if settings.DISTANCE_CACHE_PERSISTENT:
+            LocationDistance.objects.bulk_create(
+                [
+                    LocationDistance(
+                        origin_id=origin_id,
+                        destination_id=destination_id,
+                        distance=distances[(origin_id, destination_id)]
+                    )
+                    for origin_id, destination_id in missing_coordinates
+                ],
+                ignore_conflicts=True
+            )
+
+    return {
+        requested_key: distances[key]
+        for requested_key, key in requested_keys.items()
+    }
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from phonenumber_field.phonenumber import PhoneNumber
+from phonenumber_field.validators import validate_international_phonenumber
+from phonenumbers import NumberParseException
+
+from .models import Order, OrderItem, Product
+from .serializers import is_rejected_address
+
+
+# Быстрый путь для приёма заказа: явные проверки вместо обхода полей
+# OrderSerializer. Он принимает только заведомо правильные заказы в самом
+# частом виде — строки, целые числа, словари — и возвращает те же данные,
+# что и OrderSerializer. Всё остальное, включая любые ошибки, проверяет
+# OrderSerializer, поэтому ответы с ошибками не меняются.
+
+FIRSTNAME_MAX_LENGTH = Order._meta.get_field('firstname').max_length
+LASTNAME_MAX_LENGTH = Order._meta.get_field('lastname').max_length
+PHONENUMBER_MAX_LENGTH = Order._meta.get_field('phonenumber').max_length
+# Включают пределы целых чисел базы данных, которые проверяет и DRF:
+# в PostgreSQL это 2147483647.
+QUANTITY_VALIDATORS = OrderItem._meta.get_field('quantity').validators
+PRODUCT_ID_VALIDATORS = Product._meta.pk.validators
+
+
+def is_valid_value(value, validators):
+    try:
+        for validator in validators:
+            validator(value)
+    except ValidationError:
+        return False
+    return True
+
+
+def clean_text(value, max_length=None, allow_blank=False):
+    # Как serializers.CharField: пробелы по краям отбрасываются.
+    if type(value) is not str or '\x00' in value:
+        return None
+    value = value.strip()
+    if not value and not allow_blank:
+        return None
+    if max_length is not None and len(value) > max_length:
+        return None
+    return value
+
+
+def clean_phonenumber(value):
+    value = clean_text(value, PHONENUMBER_MAX_LENGTH)
+    if value is None:
+        return None
+    try:
+        validate_international_phonenumber(value)
+        phonenumber = PhoneNumber.from_string(value, 'RU')
+    except (ValidationError, NumberParseException):
+        return None
+    if not phonenumber.is_valid():
+        return None
+    return phonenumber
+
+
+def clean_product_items(product_items, products):
+    if type(product_items) is not list or not product_items:
+        return None
+    cleaned_items = []
+    product_ids = set()
+    for product_item in product_items:
+        if type(product_item) is not dict:
+            return None
+        product_id = product_item.get('product')
+        quantity = product_item.get('quantity')
+        if type(product_id) is not int or type(quantity) is not int:
+            return None
+        if not is_valid_value(product_id, PRODUCT_ID_VALIDATORS):
+            return None
+        if not is_valid_value(quantity, QUANTITY_VALIDATORS):
+            return None
+        product = products.get(product_id)
+        if not product or product_id in product_ids:
+            return None
+        product_ids.add(product_id)
+        cleaned_items.append(OrderedDict([('product', product), ('quantity', quantity)]))
+    return cleaned_items
+
+
+def validate_order(order_params, products):
+    # Возвращает validated_data как у OrderSerializer или None, если заказ
+    # нужно проверить OrderSerializer.
+    if type(order_params) is not dict:
+        return None
+    validated_data = OrderedDict()
+    validated_data['products'] = clean_product_items(order_params.get('products'), products)
+    validated_data['firstname'] = clean_text(order_params.get('firstname'), FIRSTNAME_MAX_LENGTH)
+    if 'lastname' in order_params:
+        validated_data['lastname'] = clean_text(
+            order_params['lastname'],
+            LASTNAME_MAX_LENGTH,
+            allow_blank=True
+        )
+    validated_data['phonenumber'] = clean_phonenumber(order_params.get('phonenumber'))
+    validated_data['address'] = clean_text(order_params.get('address'))
+    if any(value is None for value in validated_data.values()):
+        return None
+    if is_rejected_address(validated_data['address']):
+        return None
+    return validated_data
+
+
+def dump_text(value):
+    return None if value is None else str(value)
+
+
+def serialize_order(order):
+    return OrderedDict([
+        ('id', order.id),
+        ('firstname', dump_text(order.firstname)),
+        ('lastname', dump_text(order.lastname)),
+        ('phonenumber', dump_text(order.phonenumber)),
+        ('address', dump_text(order.address)),
+    ])
+
+
+def serialize_order_data(validated_data):
+    # Как OrderSerializer(data=...).data: без id, а необязательная фамилия —
+    # только если её прислали.
+    dumped_order = OrderedDict()
+    for field in ['firstname', 'lastname', 'phonenumber', 'address']:
+        if field in validated_data:
+            dumped_order[field] = dump_text(validated_data[field])
+    return dumped_order
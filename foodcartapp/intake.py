@@ -0,0 +1,246 @@
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Order, Product
+from .serializers import create_orders
+
+
+logger = logging.getLogger(__name__)
+
+# Ошибки в самой записи журнала. Ошибок соединения с базой здесь нет: при
+# них воркер падает, и сегмент обрабатывается заново целиком.
+RECORD_ERRORS = (DataError, IntegrityError, KeyError, TypeError, ValueError)
+
+JOURNAL_NAME = 'orders.journal'
+SEALED_SUFFIX = '.sealed'
+REJECTED_NAME = 'orders.rejected'
+DRAIN_LOCK_NAME = 'drain.lock'
+
+# Журнал приёма заказов — append-only файлы в ORDER_INTAKE_JOURNAL_DIR.
+# Каждая запись — строка «crc32 json», заказ подтверждается клиенту только
+# после fsync. Воркер drain_order_intake переименовывает текущий журнал
+# в запечатанный сегмент, переносит его заказы в базу и удаляет сегмент.
+# Если воркер упал, сегмент обрабатывается заново, а уникальный
+# Order.intake_id не даёт создать заказ дважды. Записи, которые нельзя
+# превратить в заказ или не удалось записать в базу, воркер откладывает в REJECTED_NAME для разбора вручную.
+
+
+def is_intake_journal_enabled():
+    return bool(settings.ORDER_INTAKE_JOURNAL_DIR)
+
+
+def fsync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def encode_record(record):
+    payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode()
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def decode_records(content):
+    # Возвращает записи и число битых строк. Битой бывает последняя строка,
+    # если процесс упал посреди записи: такой заказ не был подтверждён.
+    records, broken_count = [], 0
+    for line in content.split(b'\n'):
+        if not line:
+            continue
+        checksum, _, payload = line.partition(b' ')
+        try:
+            if int(checksum, 16) != zlib.crc32(payload):
+                raise ValueError('checksum mismatch')
+            records.append(json.loads(payload))
+        except ValueError:
+            broken_count += 1
+    return records, broken_count
+
+
+def is_same_file(fd, path):
+    try:
+        return os.fstat(fd).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def append_to_journal(record, journal_dir=None):
+    journal_dir = journal_dir or settings.ORDER_INTAKE_JOURNAL_DIR
+    os.makedirs(journal_dir, exist_ok=True)
+    path = os.path.join(journal_dir, JOURNAL_NAME)
+    content = encode_record(record)
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Пока ждали блокировку, воркер мог запечатать этот файл.
+            if not is_same_file(fd, path):
+                continue
+            is_new_file = not os.fstat(fd).st_size
+            os.write(fd, content)
+            os.fsync(fd)
+            if is_new_file:
+                fsync_directory(journal_dir)
+            return
+        finally:
+            os.close(fd)
+
+
+def seal_journal(journal_dir):
+    path = os.path.join(journal_dir, JOURNAL_NAME)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if is_same_file(fd, path) and os.fstat(fd).st_size:
+            os.rename(path, os.path.join(journal_dir, f'{time.time_ns()}{SEALED_SUFFIX}'))
+            fsync_directory(journal_dir)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def drain_lock(journal_dir):
+    fd = os.open(os.path.join(journal_dir, DRAIN_LOCK_NAME), os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def reject_records(records, journal_dir):
+    # Пишет только воркер под drain_lock, поэтому без flock.
+    path = os.path.join(journal_dir, REJECTED_NAME)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        is_new_file = not os.fstat(fd).st_size
+        os.write(fd, b''.join(encode_record(record) for record in records))
+        os.fsync(fd)
+        if is_new_file:
+            fsync_directory(journal_dir)
+    finally:
+        os.close(fd)
+
+
+def journal_order(validated_data, intake_id):
+    append_to_journal({
+        'intake_id': str(intake_id),
+        'registered_at': timezone.now().isoformat(),
+        'firstname': validated_data.get('firstname'),
+        'lastname': validated_data.get('lastname'),
+        'phonenumber': str(validated_data.get('phonenumber')),
+        'address': validated_data.get('address'),
+        'products': [
+            {
+                'product': product_item.get('product').id,
+                'price': str(product_item.get('product').price),
+                'quantity': product_item.get('quantity'),
+            }
+            for product_item in validated_data.get('products')
+        ],
+    })
+
+
+@transaction.atomic
+def save_journal_records(records):
+    intake_ids = [uuid.UUID(record['intake_id']) for record in records]
+    saved_intake_ids = set(
+        Order.objects.filter(intake_id__in=intake_ids).values_list('intake_id', flat=True)
+    )
+    records = [
+        record for record, intake_id in zip(records, intake_ids)
+        if intake_id not in saved_intake_ids
+    ]
+    products = Product.objects.in_bulk({
+        product_item['product']
+        for record in records
+        for product_item in record['products']
+    })
+    # Товар, удалённый после подтверждения заказа, выпадает из заказа, цена
+    # остальных позиций — та, что была при подтверждении. Заказ, от которого
+    # не осталось ни одного товара, не создаётся, а возвращается отклонённым.
+    orders_data, rejected_records = [], []
+    for record in records:
+        order_products = [
+            {
+                'product': products[product_item['product']],
+                'price': Decimal(product_item['price']),
+                'quantity': product_item['quantity'],
+            }
+            for product_item in record['products']
+            if product_item['product'] in products
+        ]
+        if not order_products:
+            rejected_records.append(record)
+            continue
+        orders_data.append({
+            **record,
+            'intake_id': uuid.UUID(record['intake_id']),
+            'registered_at': parse_datetime(record['registered_at']),
+            'products': order_products,
+        })
+    return create_orders(orders_data), rejected_records
+
+
+def save_journal_batch(records):
+    # Плохая запись не должна держать журнал: пачку, которая не записалась,
+    # воркер записывает заново по одной записи и отклоняет непрошедшие.
+    try:
+        return save_journal_records(records)
+    except RECORD_ERRORS:
+        if len(records) == 1:
+            logger.exception('Не удалось перенести запись журнала %s', records[0])
+            return [], records
+    orders, rejected_records = [], []
+    for record in records:
+        record_orders, record_rejected_records = save_journal_batch([record])
+        orders.extend(record_orders)
+        rejected_records.extend(record_rejected_records)
+    return orders, rejected_records
+
+
+def drain_journal(journal_dir=None, batch_size=500):
+    # Сначала дорабатываются сегменты, оставшиеся от упавшего воркера.
+    journal_dir = journal_dir or settings.ORDER_INTAKE_JOURNAL_DIR
+    os.makedirs(journal_dir, exist_ok=True)
+    orders, broken_count, rejected_count = [], 0, 0
+    with drain_lock(journal_dir):
+        seal_journal(journal_dir)
+        segment_names = sorted(
+            name for name in os.listdir(journal_dir) if name.endswith(SEALED_SUFFIX)
+        )
+        for segment_name in segment_names:
+            segment_path = os.path.join(journal_dir, segment_name)
+            with open(segment_path, 'rb') as segment:
+                records, segment_broken_count = decode_records(segment.read())
+            broken_count += segment_broken_count
+            rejected_records = []
+            for start in range(0, len(records), batch_size):
+                batch_orders, batch_rejected_records = save_journal_batch(
+                    records[start:start + batch_size]
+                )
+                orders.extend(batch_orders)
+                rejected_records.extend(batch_rejected_records)
+            if rejected_records:
+                reject_records(rejected_records, journal_dir)
+                rejected_count += len(rejected_records)
+            os.remove(segment_path)
+            fsync_directory(journal_dir)
+    return orders, broken_count, rejected_count
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.assignment import assign_restaurants
+
+
+class Command(BaseCommand):
+    help = 'Назначает рестораны принятым заказам с минимальной суммарной длиной доставки'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='повторять назначение каждые INTERVAL секунд',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            assigned_orders = assign_restaurants()
+            self.stdout.write(f'Назначено заказов: {len(assigned_orders)}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,78 @@
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from foodcartapp.fast_serializers import serialize_order, validate_order
+from foodcartapp.models import Product
+from foodcartapp.serializers import OrderSerializer, build_order
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость OrderSerializer и быстрого пути приёма заказа'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--items',
+            type=int,
+            default=5,
+            help='сколько позиций в заказе',
+        )
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=2000,
+            help='сколько раз повторить каждый замер',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.in_bulk(
+            Product.objects.values_list('id', flat=True)[:options['items']]
+        )
+        if not products:
+            raise CommandError('Нужен хотя бы один товар в базе')
+        order_params = {
+            'products': [
+                {'product': product_id, 'quantity': 2}
+                for product_id in products
+            ],
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва, Новый Арбат, 10',
+        }
+
+        def validate_with_drf():
+            serializer = OrderSerializer(data=order_params, context={'products': products})
+            serializer.is_valid(raise_exception=True)
+            return serializer.validated_data
+
+        def validate_fast():
+            return validate_order(order_params, products)
+
+        order = build_order(validate_fast())
+        order.id = 1
+        renderer = JSONRenderer()
+
+        def render_with_drf():
+            return renderer.render(OrderSerializer(order).data)
+
+        def render_fast():
+            return renderer.render(serialize_order(order))
+
+        if validate_with_drf() != validate_fast():
+            raise CommandError('Быстрый путь проверил заказ не так, как OrderSerializer')
+        if render_with_drf() != render_fast():
+            raise CommandError('Быстрый путь отдал не тот же ответ, что OrderSerializer')
+
+        for name, drf_function, fast_function in [
+            ('Проверка заказа', validate_with_drf, validate_fast),
+            ('Ответ', render_with_drf, render_fast),
+        ]:
+            drf_time = timeit.timeit(drf_function, number=options['number']) / options['number']
+            fast_time = timeit.timeit(fast_function, number=options['number']) / options['number']
+            self.stdout.write(
+                f'{name}: OrderSerializer {drf_time * 10 ** 6:.1f} мкс, '
+                f'быстрый путь {fast_time * 10 ** 6:.1f} мкс, '
+                f'в {drf_time / fast_time:.1f} раза быстрее'
+            )
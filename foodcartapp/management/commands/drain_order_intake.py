@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.intake import drain_journal
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Переносит заказы из журнала приёма в базу данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='повторять перенос каждые INTERVAL секунд',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='сколько заказов записывать в базу одной транзакцией',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            orders, broken_count, rejected_count = drain_journal(
+                batch_size=options['batch_size']
+            )
+            if orders:
+                Order.objects.filter(pk__in=[order.id for order in orders]).geocode()
+            self.stdout.write(
+                f'Перенесено заказов: {len(orders)}, битых записей: {broken_count}, '
+                f'отклонено заказов: {rejected_count}'
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
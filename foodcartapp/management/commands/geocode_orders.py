@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Определяет координаты заказов, ожидающих геокодирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-not-found',
+            action='store_true',
+            help='повторить геокодирование заказов с ненайденным адресом',
+        )
+
+    def handle(self, *args, **options):
+        orders = Order.objects.pending_geocoding()
+        if options['retry_not_found']:
+            orders |= Order.objects.filter(geocoding_status=Order.NOT_FOUND)
+
+        orders = orders.geocode()
+        geocoded_count = sum(
+            order.geocoding_status == Order.GEOCODED for order in orders
+        )
+        self.stdout.write(
+            f'Обработано заказов: {len(orders)}, '
+            f'координаты определены: {geocoded_count}'
+        )
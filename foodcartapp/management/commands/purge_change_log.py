@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import CatalogChange, OrderChange
+
+
+class Command(BaseCommand):
+    help = 'Удаляет устаревшие записи журналов изменений каталога и заказов'
+
+    def handle(self, *args, **options):
+        deleted_catalog_count, _ = CatalogChange.objects.expired().delete()
+        deleted_orders_count, _ = OrderChange.objects.expired().delete()
+        self.stdout.write(
+            f'Удалено изменений каталога: {deleted_catalog_count}, '
+            f'заказов: {deleted_orders_count}'
+        )
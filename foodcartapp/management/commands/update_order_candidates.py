@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.availability import update_orders_candidates
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рестораны, способные выполнить открытые заказы'
+
+    def handle(self, *args, **options):
+        orders = Order.objects.filter(status__in=Order.ACTIVE_STATUSES)\
+                              .select_related('location')
+        orders_candidates = update_orders_candidates(orders)
+        self.stdout.write(f'Пересчитано заказов: {len(orders_candidates)}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохранённую стоимость заказов по их позициям'
+
+    def handle(self, *args, **options):
+        updated_count = Order.objects.update_totals()
+        self.stdout.write(f'Пересчитано заказов: {updated_count}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает загрузку ресторанов по их заказам'
+
+    def handle(self, *args, **options):
+        updated_count = Restaurant.objects.update_loads()
+        self.stdout.write(f'Пересчитано ресторанов: {updated_count}')
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.15 on 2026-10-18 02:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0003_location_geocoder_cache'),
+        ('foodcartapp', '0050_rename_registrated_at_order_registered_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='geocoding_status',
+            field=models.CharField(choices=[('pending', 'Ожидает геокодирования'), ('geocoded', 'Координаты определены'), ('not found', 'Адрес не найден')], db_index=True, default='pending', max_length=9, verbose_name='статус геокодирования'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='locations.location', verbose_name='локация'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.15 on 2026-10-18 02:53
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderItem = apps.get_model('foodcartapp', 'OrderItem')
+
+    totals = OrderItem.objects.filter(order=OuterRef('pk'))\
+                              .values('order')\
+                              .annotate(total=Sum(
+                                  F('price') * F('quantity'),
+                                  output_field=models.DecimalField(max_digits=10, decimal_places=2)
+                              ))\
+                              .values('total')
+    Order.objects.update(total=Coalesce(Subquery(totals), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0051_order_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='стоимость'),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.15 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0053_catalogchange'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['registered_at', 'id'], name='foodcartapp_registe_a63c12_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'registered_at', 'id'], name='foodcartapp_status_618cc3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_method', 'registered_at', 'id'], name='foodcartapp_payment_837b62_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['restaurant', 'registered_at', 'id'], name='foodcartapp_restaur_8a5854_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0055_orderchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='capacity',
+            field=models.PositiveSmallIntegerField(default=10, help_text='сколько принятых и собираемых заказов ресторан успевает готовить', verbose_name='заказов в работе одновременно'),
+        ),
+    ]
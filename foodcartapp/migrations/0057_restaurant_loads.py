@@ -0,0 +1,46 @@
+# Generated by Django 3.2.15 on 2026-10-18 03:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_restaurant_loads(apps, schema_editor):
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    Order = apps.get_model('foodcartapp', 'Order')
+
+    orders = Order.objects.filter(restaurant=OuterRef('pk'))\
+                          .values('restaurant')\
+                          .annotate(count=Count('id'))\
+                          .values('count')
+    Restaurant.objects.update(
+        kitchen_load=Coalesce(
+            Subquery(orders.filter(status__in=['accepted', 'in process'])),
+            Value(0)
+        ),
+        delivery_load=Coalesce(
+            Subquery(orders.filter(status='in delivery')),
+            Value(0)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0056_restaurant_capacity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='delivery_load',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='заказов в пути'),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='kitchen_load',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='заказов готовится'),
+        ),
+        migrations.RunPython(fill_restaurant_loads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.15 on 2026-10-18 03:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0057_restaurant_loads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivery_restaurants',
+            field=models.ManyToManyField(blank=True, related_name='deliverable_orders', to='foodcartapp.Restaurant', verbose_name='рестораны, доставляющие по адресу'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='in_delivery_zone',
+            field=models.BooleanField(blank=True, db_index=True, null=True, verbose_name='адрес в зоне доставки'),
+        ),
+        migrations.CreateModel(
+            name='DeliveryZone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=50, verbose_name='название')),
+                ('polygon', models.JSONField(help_text='вершины многоугольника: [[широта, долгота], ...]', verbose_name='границы')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_zones', to='foodcartapp.restaurant', verbose_name='ресторан')),
+            ],
+            options={
+                'verbose_name': 'зона доставки',
+                'verbose_name_plural': 'зоны доставки',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.15 on 2026-10-18 03:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0058_delivery_zones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.FloatField(blank=True, null=True, verbose_name='расстояние, км')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='foodcartapp.order', verbose_name='заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_candidates', to='foodcartapp.restaurant', verbose_name='ресторан')),
+            ],
+            options={
+                'verbose_name': 'ресторан, способный выполнить заказ',
+                'verbose_name_plural': 'рестораны, способные выполнить заказ',
+                'unique_together': {('order', 'restaurant')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.15 on 2026-10-18 03:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0059_ordercandidate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='хэш ключа')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='хэш запроса')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='код ответа')),
+                ('response', models.JSONField(verbose_name='ответ')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='создан')),
+            ],
+            options={
+                'verbose_name': 'ключ идемпотентности',
+                'verbose_name_plural': 'ключи идемпотентности',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0060_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='intake_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True, verbose_name='id в журнале приёма'),
+        ),
+    ]
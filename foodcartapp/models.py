@@ -1,10 +1,86 @@
-from django.db import models
-from django.db.models import Sum, F
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from django.dispatch import Signal
 from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
 from locations.models import Location
+from .utils import lookup_locations
+
+
+logger = logging.getLogger(__name__)
+
+# Отправляется после геокодирования заказов с аргументом orders.
+orders_geocoded = Signal()
+
+GEOCODING_BATCH_SIZE = 100
+
+# Заказы на фоновое геокодирование копятся в очереди, а разбирает её один
+# поток пачками: всплеск заказов не плодит потоки, а адреса пачки
+# геокодируются через общий пул запросов к геокодеру.
+geocoding_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='geocoding')
+geocoding_queue = []
+geocoding_lock = Lock()
+is_geocoding_scheduled = False
+
+
+def geocode_queued_orders():
+    global is_geocoding_scheduled
+    while True:
+        with geocoding_lock:
+            order_ids = geocoding_queue[:GEOCODING_BATCH_SIZE]
+            del geocoding_queue[:GEOCODING_BATCH_SIZE]
+            if not order_ids:
+                is_geocoding_scheduled = False
+                return
+        try:
+            Order.objects.filter(pk__in=order_ids).geocode()
+        except Exception:
+            # Заказы останутся в ожидании до запуска geocode_orders.
+            logger.exception('Не удалось геокодировать заказы %s', order_ids)
+
+
+def run_geocoding():
+    try:
+        geocode_queued_orders()
+    finally:
+        connection.close()
+
+
+class RestaurantQuerySet(models.QuerySet):
+    def add_load(self, status, count):
+        if status in Order.KITCHEN_STATUSES:
+            return self.update(kitchen_load=Greatest(F('kitchen_load') + count, 0))
+        if status == Order.IN_DELIVERY:
+            return self.update(delivery_load=Greatest(F('delivery_load') + count, 0))
+        return 0
+
+    def update_loads(self):
+        # Счётчики загрузки меняются сигналами заказов; пересчёт нужен, только
+        # если заказы правили в обход моделей.
+        orders = Order.objects.filter(restaurant=OuterRef('pk'))\
+                              .values('restaurant')\
+                              .annotate(count=Count('id'))\
+                              .values('count')
+        return self.update(
+            kitchen_load=Coalesce(
+                Subquery(orders.filter(status__in=Order.KITCHEN_STATUSES)),
+                Value(0)
+            ),
+            delivery_load=Coalesce(
+                Subquery(orders.filter(status=Order.IN_DELIVERY)),
+                Value(0)
+            ),
+        )
 
 
 class Restaurant(models.Model):
@@ -29,6 +105,23 @@ class Restaurant(models.Model):
         blank=True,
         on_delete=models.SET_NULL,
     )
+    capacity = models.PositiveSmallIntegerField(
+        'заказов в работе одновременно',
+        default=10,
+        help_text='сколько принятых и собираемых заказов ресторан успевает готовить',
+    )
+    kitchen_load = models.PositiveIntegerField(
+        'заказов готовится',
+        default=0,
+        editable=False,
+    )
+    delivery_load = models.PositiveIntegerField(
+        'заказов в пути',
+        default=0,
+        editable=False,
+    )
+
+    objects = RestaurantQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'ресторан'
@@ -37,6 +130,49 @@ class Restaurant(models.Model):
     def __str__(self):
         return self.name
 
+    def get_load_ratio(self):
+        if not self.capacity:
+            return 1
+        return self.kitchen_load / self.capacity
+
+
+class DeliveryZone(models.Model):
+    restaurant = models.ForeignKey(
+        Restaurant,
+        related_name='delivery_zones',
+        verbose_name='ресторан',
+        on_delete=models.CASCADE,
+    )
+    name = models.CharField(
+        'название',
+        max_length=50,
+        blank=True,
+    )
+    polygon = models.JSONField(
+        'границы',
+        help_text='вершины многоугольника: [[широта, долгота], ...]',
+    )
+
+    class Meta:
+        verbose_name = 'зона доставки'
+        verbose_name_plural = 'зоны доставки'
+
+    def __str__(self):
+        return f"{self.restaurant.name} - {self.name or self.id}"
+
+    def clean(self):
+        if not isinstance(self.polygon, list) or len(self.polygon) < 3:
+            raise ValidationError({'polygon': 'Нужно хотя бы три вершины'})
+        for point in self.polygon:
+            if not (
+                isinstance(point, list)
+                and len(point) == 2
+                and all(isinstance(coordinate, (int, float)) for coordinate in point)
+                and -90 <= point[0] <= 90
+                and -180 <= point[1] <= 180
+            ):
+                raise ValidationError({'polygon': f'Неверная вершина: {point}'})
+
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
@@ -105,6 +241,64 @@ class Product(models.Model):
         return self.name
 
 
+class ChangeLogQuerySet(models.QuerySet):
+    # id изменения выдаётся при вставке строки, а видна строка только после
+    # коммита. Изменение с меньшим id может появиться уже после того, как
+    # клиент прочитал изменения с большими, поэтому чтение после id захватывает
+    # и недавние изменения: транзакция, записавшая изменение, должна успеть
+    # закоммититься за CHANGE_LOG_REREAD_SECONDS. Повторно прочитанные
+    # изменения клиенты применяют ещё раз, это безопасно.
+    def after(self, change_id):
+        reread_since = timezone.now() - timedelta(seconds=settings.CHANGE_LOG_REREAD_SECONDS)
+        return self.filter(Q(id__gt=change_id) | Q(changed_at__gte=reread_since))
+
+    def expired(self):
+        expiration_date = timezone.now() - timedelta(days=settings.CHANGE_LOG_RETENTION_DAYS)
+        return self.filter(changed_at__lt=expiration_date)
+
+    def is_purged_after(self, change_id):
+        # Изменения после change_id могли быть удалены, если самое старое
+        # сохранённое изменение идёт не сразу за ним.
+        oldest_id = self.aggregate(oldest_id=models.Min('id'))['oldest_id']
+        return oldest_id is not None and oldest_id > change_id + 1
+
+
+class CatalogChangeQuerySet(ChangeLogQuerySet):
+    def get_latest_token(self):
+        return self.aggregate(token=models.Max('id'))['token'] or 0
+
+    def get_latest(self):
+        # Токен и время последнего изменения; (0, None), если изменений нет.
+        latest = self.aggregate(token=models.Max('id'), changed_at=models.Max('changed_at'))
+        return latest['token'] or 0, latest['changed_at']
+
+    def record(self, product_ids):
+        return self.bulk_create(
+            [CatalogChange(product_id=product_id) for product_id in product_ids]
+        )
+
+
+class CatalogChange(models.Model):
+    product_id = models.PositiveIntegerField(
+        'id товара',
+        db_index=True
+    )
+    changed_at = models.DateTimeField(
+        'время изменения',
+        default=timezone.now,
+        db_index=True
+    )
+
+    objects = CatalogChangeQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'изменение каталога'
+        verbose_name_plural = 'изменения каталога'
+
+    def __str__(self):
+        return f"Товар №{self.product_id}: изменение №{self.id}"
+
+
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
         Restaurant,
@@ -136,10 +330,43 @@ class RestaurantMenuItem(models.Model):
 
 
 class OrderQuerySet(models.QuerySet):
-    def fetch_with_cost(self):
-        return self.annotate(
-            cost=Sum(F('order_items__price')) * F('order_items__quantity')
-        )
+    def update_totals(self):
+        totals = OrderItem.objects.filter(order=OuterRef('pk'))\
+                                  .values('order')\
+                                  .annotate(total=OrderItem.TOTAL)\
+                                  .values('total')
+        return self.update(total=Coalesce(Subquery(totals), Value(0)))
+
+    def pending_geocoding(self):
+        return self.filter(geocoding_status=Order.PENDING)
+
+    def geocode(self):
+        orders = list(self)
+        locations = lookup_locations(order.address for order in orders)
+        for order in orders:
+            location = locations[order.address]
+            if not location:
+                continue
+            if location.is_found():
+                order.location = location
+                order.geocoding_status = Order.GEOCODED
+            else:
+                order.location = None
+                order.geocoding_status = Order.NOT_FOUND
+        Order.objects.bulk_update(orders, ['location', 'geocoding_status'])
+        orders_geocoded.send(sender=Order, orders=orders)
+        OrderChange.objects.record(order.id for order in orders)
+        return orders
+
+    def geocode_in_background(self):
+        global is_geocoding_scheduled
+        order_ids = list(self.values_list('id', flat=True))
+        with geocoding_lock:
+            geocoding_queue.extend(order_ids)
+            if is_geocoding_scheduled or not geocoding_queue:
+                return
+            is_geocoding_scheduled = True
+        geocoding_executor.submit(run_geocoding)
 
 
 class Order(models.Model):
@@ -150,6 +377,9 @@ class Order(models.Model):
     ONLINE = 'online'
     CARD = 'by card'
     CASH = 'cash'
+    PENDING = 'pending'
+    GEOCODED = 'geocoded'
+    NOT_FOUND = 'not found'
 
     STATUSES = [
         (ACCEPTED, 'Принят'),
@@ -162,6 +392,13 @@ class Order(models.Model):
         (CARD, 'Картой при получении'),
         (CASH, 'Наличными при получении')
     ]
+    ACTIVE_STATUSES = [ACCEPTED, IN_PROCESS, IN_DELIVERY]
+    KITCHEN_STATUSES = [ACCEPTED, IN_PROCESS]
+    GEOCODING_STATUSES = [
+        (PENDING, 'Ожидает геокодирования'),
+        (GEOCODED, 'Координаты определены'),
+        (NOT_FOUND, 'Адрес не найден')
+    ]
     products = models.ManyToManyField(
         Product,
         through='OrderItem',
@@ -215,6 +452,33 @@ class Order(models.Model):
     address = models.TextField(
         'адрес доставки'
     )
+    location = models.ForeignKey(
+        Location,
+        verbose_name='локация',
+        null=True,
+        blank=True,
+        related_name='orders',
+        on_delete=models.SET_NULL,
+    )
+    geocoding_status = models.CharField(
+        'статус геокодирования',
+        max_length=9,
+        choices=GEOCODING_STATUSES,
+        default=PENDING,
+        db_index=True
+    )
+    in_delivery_zone = models.BooleanField(
+        'адрес в зоне доставки',
+        null=True,
+        blank=True,
+        db_index=True
+    )
+    delivery_restaurants = models.ManyToManyField(
+        Restaurant,
+        related_name='deliverable_orders',
+        verbose_name='рестораны, доставляющие по адресу',
+        blank=True,
+    )
     status = models.CharField(
         'статус',
         max_length=11,
@@ -226,18 +490,108 @@ class Order(models.Model):
         'комментарий',
         blank=True
     )
+    total = models.DecimalField(
+        'стоимость',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)]
+    )
+    intake_id = models.UUIDField(
+        'id в журнале приёма',
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+    )
 
     objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
+        indexes = [
+            models.Index(fields=['registered_at', 'id']),
+            models.Index(fields=['status', 'registered_at', 'id']),
+            models.Index(fields=['payment_method', 'registered_at', 'id']),
+            models.Index(fields=['restaurant', 'registered_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Заказ №{self.id} по адресу {self.address}"
 
+    def update_total(self):
+        self.total = self.order_items.aggregate(total=OrderItem.TOTAL)['total'] or 0
+        self.save(update_fields=['total'])
+
+
+class OrderChangeQuerySet(ChangeLogQuerySet):
+    def get_latest_id(self):
+        return self.aggregate(latest_id=models.Max('id'))['latest_id'] or 0
+
+    def record(self, order_ids):
+        return self.bulk_create(
+            [OrderChange(order_id=order_id) for order_id in order_ids]
+        )
+
+
+class OrderChange(models.Model):
+    order_id = models.PositiveIntegerField(
+        'id заказа',
+        db_index=True
+    )
+    changed_at = models.DateTimeField(
+        'время изменения',
+        default=timezone.now,
+        db_index=True
+    )
+
+    objects = OrderChangeQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'изменение заказа'
+        verbose_name_plural = 'изменения заказов'
+
+    def __str__(self):
+        return f"Заказ №{self.order_id}: изменение №{self.id}"
+
+
+class OrderCandidate(models.Model):
+    order = models.ForeignKey(
+        Order,
+        related_name='candidates',
+        verbose_name='заказ',
+        on_delete=models.CASCADE,
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        related_name='order_candidates',
+        verbose_name='ресторан',
+        on_delete=models.CASCADE,
+    )
+    distance = models.FloatField(
+        'расстояние, км',
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'ресторан, способный выполнить заказ'
+        verbose_name_plural = 'рестораны, способные выполнить заказ'
+        unique_together = [
+            ['order', 'restaurant']
+        ]
+
+    def __str__(self):
+        return f"Заказ №{self.order_id} - {self.restaurant_id}"
+
 
 class OrderItem(models.Model):
+    TOTAL = Sum(
+        F('price') * F('quantity'),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2)
+    )
+
     order = models.ForeignKey(
         Order,
         on_delete=models.CASCADE,
@@ -270,3 +624,46 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.order}: {self.product} - {self.quantity} штук"
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def expired(self):
+        expiration_date = timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+        return self.filter(created_at__lt=expiration_date)
+
+
+class IdempotencyKey(models.Model):
+    # Хранится не сам ключ клиента, а его SHA-256: строки фиксированной длины,
+    # индекс по ним компактный.
+    key = models.CharField(
+        'хэш ключа',
+        max_length=64,
+        unique=True,
+    )
+    request_hash = models.CharField(
+        'хэш запроса',
+        max_length=64,
+    )
+    status_code = models.PositiveSmallIntegerField(
+        'код ответа'
+    )
+    response = models.JSONField(
+        'ответ'
+    )
+    created_at = models.DateTimeField(
+        'создан',
+        default=timezone.now,
+        db_index=True
+    )
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
+
+    def is_expired(self):
+        return self.created_at < timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
@@ -0,0 +1,84 @@
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from django.conf import settings
+
+from .models import Order
+from .utils import get_distance_matrix
+
+
+Route = namedtuple('Route', ['restaurant', 'stops', 'distance'])
+RouteStop = namedtuple('RouteStop', ['order', 'distance'])
+
+
+def get_path_distance(path, distances):
+    return float(distances[path[:-1], path[1:]].sum())
+
+
+def improve_route(path, distances):
+    # 2-opt для незамкнутого пути: курьер не возвращается в ресторан, поэтому
+    # у разворота хвоста пути меняется только одно ребро.
+    path = list(path)
+    improved = True
+    while improved:
+        improved = False
+        for start in range(1, len(path) - 1):
+            for end in range(start + 1, len(path)):
+                removed = distances[path[start - 1], path[start]]
+                added = distances[path[start - 1], path[end]]
+                if end + 1 < len(path):
+                    removed += distances[path[end], path[end + 1]]
+                    added += distances[path[start], path[end + 1]]
+                if added < removed - 1e-9:
+                    path[start:end + 1] = reversed(path[start:end + 1])
+                    improved = True
+    return path
+
+
+def plan_routes(distances, stops_count):
+    # distances — матрица расстояний, где точка 0 — ресторан, остальные —
+    # адреса заказов. Маршрут набирается ближайшим соседом от ресторана,
+    # затем порядок точек улучшается 2-opt. Возвращает номера точек маршрутов
+    # без ресторана.
+    distances = np.asarray(distances, dtype=float)
+    unvisited = np.ones(len(distances), dtype=bool)
+    unvisited[0] = False
+    routes = []
+    while unvisited.any():
+        path = [0]
+        while len(path) <= stops_count and unvisited.any():
+            nearest = int(np.argmin(np.where(unvisited, distances[path[-1]], np.inf)))
+            unvisited[nearest] = False
+            path.append(nearest)
+        routes.append(improve_route(path, distances)[1:])
+    return routes
+
+
+def get_delivery_routes(stops_count=None):
+    stops_count = stops_count or settings.ROUTE_STOPS
+    orders = Order.objects.filter(
+        status=Order.IN_DELIVERY,
+        restaurant__coordinates__lat__isnull=False,
+        location__lat__isnull=False,
+    ).select_related('location', 'restaurant__coordinates')\
+     .order_by('registered_at', 'id')
+    restaurants_orders = defaultdict(list)
+    for order in orders:
+        restaurants_orders[order.restaurant].append(order)
+
+    routes = []
+    for restaurant, orders in restaurants_orders.items():
+        points = [restaurant.coordinates.get_coordinates()]
+        points.extend(order.location.get_coordinates() for order in orders)
+        distances = get_distance_matrix(points, points)
+        for route in plan_routes(distances, stops_count):
+            path = [0, *route]
+            routes.append(Route(
+                restaurant=restaurant,
+                stops=[
+                    RouteStop(orders[point - 1], float(distances[previous_point, point]))
+                    for previous_point, point in zip(path, route)
+                ],
+                distance=get_path_distance(path, distances),
+            ))
+    return routes
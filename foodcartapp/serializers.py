@@ -1,11 +1,121 @@
-from rest_framework.serializers import ModelSerializer, ValidationError
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from rest_framework.serializers import (
+    ModelSerializer,
+    PrimaryKeyRelatedField,
+    ValidationError
+)
 from phonenumber_field.phonenumber import PhoneNumber
 
-from .models import Order, OrderItem, Restaurant
-from .utils import fetch_coordinates
+from locations.models import Location
+from .models import Order, OrderChange, OrderItem, Product, Restaurant
+from .utils import get_or_fetch_location, normalize_address
+from .zones import is_deliverable
+
+
+class ProductField(PrimaryKeyRelatedField):
+    # Товары заказа достаются из базы одним запросом в OrderSerializer,
+    # а не по запросу на каждую позицию.
+    def to_internal_value(self, data):
+        products = self.context.get('products')
+        if products is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            product = products.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if not product:
+            self.fail('does_not_exist', pk_value=data)
+        return product
+
+
+def get_requested_product_ids(order_params):
+    product_ids = set()
+    if not isinstance(order_params, Mapping):
+        return product_ids
+    product_items = order_params.get('products')
+    if not isinstance(product_items, list):
+        return product_ids
+    for product_item in product_items:
+        if not isinstance(product_item, Mapping):
+            continue
+        try:
+            product_ids.add(int(product_item.get('product')))
+        except (TypeError, ValueError):
+            continue
+    return product_ids
+
+
+def is_rejected_address(address):
+    # Геокодер здесь не вызывается: проверяются только адреса, координаты
+    # которых уже есть в кэше, остальные заказы помечаются после
+    # геокодирования в фоне.
+    if not settings.REJECT_UNDELIVERABLE_ORDERS:
+        return False
+    location = Location.objects.fresh().filter(address=normalize_address(address)).first()
+    return is_deliverable(location) is False
+
+
+def get_item_price(product_item):
+    # Заказы из журнала приёма хранят цену на момент подтверждения заказа.
+    return product_item.get('price', product_item.get('product').price)
+
+
+def build_order(validated_data):
+    return Order(
+        intake_id=validated_data.get('intake_id'),
+        registered_at=validated_data.get('registered_at') or timezone.now(),
+        firstname=validated_data.get('firstname'),
+        # Фамилия необязательна, а в базе пустая фамилия — пустая строка.
+        lastname=validated_data.get('lastname') or '',
+        phonenumber=validated_data.get('phonenumber'),
+        address=validated_data.get('address'),
+        total=sum(
+            get_item_price(product_item) * product_item.get('quantity')
+            for product_item in validated_data.get('products')
+        )
+    )
+
+
+def build_order_items(order, validated_data):
+    return [
+        OrderItem(
+            order=order,
+            product=product_item.get('product'),
+            price=get_item_price(product_item),
+            quantity=product_item.get('quantity')
+        )
+        for product_item in validated_data.get('products')
+    ]
+
+
+def create_orders(orders_data):
+    orders = [build_order(validated_data) for validated_data in orders_data]
+    if connection.features.can_return_rows_from_bulk_insert:
+        # bulk_create не отправляет сигналы, изменения заказов пишутся сами.
+        Order.objects.bulk_create(orders)
+        OrderChange.objects.record(order.id for order in orders)
+    else:
+        # SQLite в Django 3.2 не возвращает id вставленных строк, а без них
+        # не создать позиции заказов.
+        for order in orders:
+            order.save(force_insert=True)
+    OrderItem.objects.bulk_create([
+        order_item
+        for order, validated_data in zip(orders, orders_data)
+        for order_item in build_order_items(order, validated_data)
+    ])
+    return orders
 
 
 class OrderItemSerializer(ModelSerializer):
+    product = ProductField(queryset=Product.objects.all())
+
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity']
@@ -18,29 +128,36 @@ class OrderSerializer(ModelSerializer):
         write_only=True
     )
 
+    def to_internal_value(self, data):
+        # Пакетный приём заказов заранее кладёт в контекст товары всех заказов.
+        if 'products' not in self.context:
+            self.context['products'] = Product.objects.in_bulk(
+                get_requested_product_ids(data)
+            )
+        return super().to_internal_value(data)
+
+    def validate_products(self, value):
+        # Позиция заказа уникальна по товару, повтор упал бы при вставке.
+        product_ids = [product_item['product'].id for product_item in value]
+        if len(set(product_ids)) < len(product_ids):
+            raise ValidationError('Each product must be listed only once.')
+        return value
+
     def validate_phonenumber(self, value):
         phonenumber = PhoneNumber.from_string(value, 'RU')
         if not phonenumber.is_valid():
             raise ValidationError(f'Invalid phone number: {value}')
         return phonenumber
 
+    def validate_address(self, value):
+        if is_rejected_address(value):
+            raise ValidationError(f'Address is outside delivery zones: {value}')
+        return value
+
     def create(self, validated_data):
-        order = Order.objects.create(
-            firstname=validated_data.get('firstname'),
-            lastname=validated_data.get('lastname'),
-            phonenumber=validated_data.get('phonenumber'),
-            address=validated_data.get('address')
-        )
-        product_list = validated_data.get('products')
-        for product_item in product_list:
-            product = product_item.get('product')
-
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                price=product.price,
-                quantity=product_item.get('quantity')
-            )
+        order = build_order(validated_data)
+        order.save(force_insert=True)
+        OrderItem.objects.bulk_create(build_order_items(order, validated_data))
 
         return order
 
@@ -58,8 +175,8 @@ class OrderSerializer(ModelSerializer):
 
 class RestaurantSerializer(ModelSerializer):
     def validate_address(self, value):
-        coordinates = fetch_coordinates(value)
-        if not coordinates:
+        location = get_or_fetch_location(value)
+        if not location:
             raise ValidationError(f'Invalid address: {value}')
         return value
 
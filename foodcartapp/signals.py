@@ -0,0 +1,187 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from locations.models import Location
+from .availability import (
+    refresh_availability,
+    update_orders_candidates,
+    update_products_orders_candidates,
+    update_restaurants_orders_candidates
+)
+from .catalog import invalidate_catalog
+from .models import (
+    CatalogChange,
+    DeliveryZone,
+    Order,
+    OrderChange,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+    orders_geocoded
+)
+from .spatial import is_restaurant_location, reset_restaurant_index
+from .zones import attach_delivery_restaurants, reset_zone_index
+
+
+@receiver(pre_save, sender=RestaurantMenuItem)
+def remember_menu_item_product(sender, instance, **kwargs):
+    instance.previous_product_id = (
+        RestaurantMenuItem.objects.filter(pk=instance.pk)
+                                  .values_list('product_id', flat=True)
+                                  .first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_menu_item_availability(sender, instance, **kwargs):
+    product_ids = {instance.product_id}
+    if getattr(instance, 'previous_product_id', None):
+        product_ids.add(instance.previous_product_id)
+    # Индекс читает меню из базы, поэтому обновляется только после коммита:
+    # откаченная правка меню не должна в него попасть.
+    transaction.on_commit(partial(refresh_availability, product_ids))
+    CatalogChange.objects.record(product_ids)
+    transaction.on_commit(partial(update_products_orders_candidates, product_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_catalog(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def record_product_change(sender, instance, **kwargs):
+    CatalogChange.objects.record([instance.id])
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(pre_delete, sender=ProductCategory)
+def record_category_change(sender, instance, **kwargs):
+    CatalogChange.objects.record(
+        instance.products.values_list('id', flat=True)
+    )
+
+
+@receiver(pre_save, sender=Restaurant)
+def remember_restaurant(sender, instance, **kwargs):
+    previous_restaurant = (
+        Restaurant.objects.filter(pk=instance.pk)
+                          .values_list('name', 'coordinates_id')
+                          .first()
+        if instance.pk else None
+    )
+    instance.previous_name, instance.previous_coordinates_id = (
+        previous_restaurant or (None, None)
+    )
+
+
+@receiver(post_save, sender=Restaurant)
+def record_restaurant_change(sender, instance, created, **kwargs):
+    # Из ресторана в каталог попадает только название — в карточках товаров
+    # его меню. У нового ресторана меню ещё нет.
+    if created or instance.previous_name == instance.name:
+        return
+    transaction.on_commit(invalidate_catalog)
+    CatalogChange.objects.record(
+        instance.menu_items.values_list('product_id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def update_restaurant_index(sender, instance, **kwargs):
+    transaction.on_commit(reset_restaurant_index)
+
+
+@receiver(post_save, sender=Restaurant)
+def update_restaurant_orders_candidates(sender, instance, created, **kwargs):
+    # Новый ресторан без меню ничьим кандидатом не станет, а его меню
+    # обновит кандидатов через сигналы пунктов меню.
+    if created or instance.previous_coordinates_id == instance.coordinates_id:
+        return
+    transaction.on_commit(
+        partial(update_restaurants_orders_candidates, [instance.id])
+    )
+
+
+@receiver(post_save, sender=Location)
+def update_restaurant_location(sender, instance, created, **kwargs):
+    if is_restaurant_location(instance.id):
+        transaction.on_commit(reset_restaurant_index)
+    if created or not getattr(instance, 'is_moved', True):
+        return
+    restaurants = Restaurant.objects.filter(coordinates=instance)
+    if restaurants.exists():
+        transaction.on_commit(
+            partial(update_restaurants_orders_candidates, restaurants)
+        )
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def record_order_change(sender, instance, **kwargs):
+    OrderChange.objects.record([instance.id])
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_load(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {'restaurant', 'status'} & set(update_fields):
+        instance.previous_load = None
+        return
+    instance.previous_load = (
+        Order.objects.filter(pk=instance.pk)
+                     .values_list('restaurant_id', 'status')
+                     .first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Order)
+def update_restaurant_load(sender, instance, created, **kwargs):
+    previous_load = getattr(instance, 'previous_load', None)
+    if not created and not previous_load:
+        return
+    current_load = (instance.restaurant_id, instance.status)
+    if previous_load == current_load:
+        return
+    if previous_load and previous_load[0]:
+        restaurant_id, status = previous_load
+        Restaurant.objects.filter(pk=restaurant_id).add_load(status, -1)
+    if instance.restaurant_id:
+        Restaurant.objects.filter(pk=instance.restaurant_id).add_load(instance.status, 1)
+
+
+@receiver(post_delete, sender=Order)
+def release_restaurant_load(sender, instance, **kwargs):
+    if instance.restaurant_id:
+        Restaurant.objects.filter(pk=instance.restaurant_id).add_load(instance.status, -1)
+
+
+@receiver(post_save, sender=DeliveryZone)
+@receiver(post_delete, sender=DeliveryZone)
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def update_zone_index(sender, instance, **kwargs):
+    transaction.on_commit(reset_zone_index)
+
+
+@receiver(orders_geocoded, sender=Order)
+def update_delivery_restaurants(sender, orders, **kwargs):
+    attach_delivery_restaurants(orders)
+
+
+@receiver(orders_geocoded, sender=Order)
+def update_geocoded_orders_candidates(sender, orders, **kwargs):
+    update_orders_candidates(orders)
@@ -0,0 +1,166 @@
+import heapq
+import math
+import time
+from threading import Lock
+
+import numpy as np
+
+from .models import Restaurant
+from .utils import EARTH_RADIUS
+
+
+INDEX_TTL = 60
+LEAF_SIZE = 8
+
+
+def get_unit_vectors(coordinates):
+    lat, lon = np.radians(np.asarray(coordinates, dtype=float).reshape(-1, 2)).T
+    return np.column_stack([
+        np.cos(lat) * np.cos(lon),
+        np.cos(lat) * np.sin(lon),
+        np.sin(lat),
+    ])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS * math.asin(min(chord / 2, 1))
+
+
+def km_to_chord(distance):
+    return 2 * math.sin(min(distance / EARTH_RADIUS, math.pi) / 2)
+
+
+class KDNode:
+    __slots__ = ['axis', 'split', 'left', 'right', 'indices']
+
+    def __init__(self, axis=None, split=None, left=None, right=None, indices=None):
+        self.axis = axis
+        self.split = split
+        self.left = left
+        self.right = right
+        self.indices = indices
+
+
+class RestaurantIndex:
+    # k-d дерево по точкам на единичной сфере: порядок по длине хорды совпадает
+    # с порядком по расстоянию вдоль поверхности Земли, поэтому поиск
+    # ближайших ресторанов и ресторанов в радиусе точный.
+    def __init__(self, restaurant_ids, coordinates, location_ids=()):
+        self.restaurant_ids = list(restaurant_ids)
+        self.location_ids = set(location_ids)
+        self.points = get_unit_vectors(coordinates)
+        self.root = self.build_node(np.arange(len(self.restaurant_ids)))
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls):
+        restaurants = Restaurant.objects.filter(coordinates__lat__isnull=False)\
+                                        .values_list('id', 'coordinates', 'coordinates__lat', 'coordinates__lon')
+        restaurant_ids, location_ids, coordinates = [], [], []
+        for restaurant_id, location_id, lat, lon in restaurants:
+            restaurant_ids.append(restaurant_id)
+            location_ids.append(location_id)
+            coordinates.append((lat, lon))
+        return cls(restaurant_ids, coordinates, location_ids)
+
+    def is_expired(self):
+        return time.monotonic() - self.built_at > INDEX_TTL
+
+    def build_node(self, indices):
+        if len(indices) <= LEAF_SIZE:
+            return KDNode(indices=indices)
+        points = self.points[indices]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        indices = indices[np.argsort(points[:, axis], kind='stable')]
+        median = len(indices) // 2
+        return KDNode(
+            axis=axis,
+            split=self.points[indices[median], axis],
+            left=self.build_node(indices[:median]),
+            right=self.build_node(indices[median:]),
+        )
+
+    def nearest(self, coordinates, count=1, restaurant_ids=None):
+        # restaurant_ids ограничивает поиск этими ресторанами, например теми,
+        # что могут приготовить заказ.
+        if not self.restaurant_ids or count < 1:
+            return []
+        point = get_unit_vectors(coordinates)[0]
+        found = []
+
+        def search(node):
+            if node.indices is not None:
+                chords = np.linalg.norm(self.points[node.indices] - point, axis=1)
+                for index, chord in zip(node.indices, chords):
+                    if restaurant_ids is not None and self.restaurant_ids[index] not in restaurant_ids:
+                        continue
+                    if len(found) < count:
+                        heapq.heappush(found, (-chord, index))
+                    elif chord < -found[0][0]:
+                        heapq.heapreplace(found, (-chord, index))
+                return
+            offset = point[node.axis] - node.split
+            near, far = (node.left, node.right) if offset < 0 else (node.right, node.left)
+            search(near)
+            if len(found) < count or abs(offset) < -found[0][0]:
+                search(far)
+
+        search(self.root)
+        return [
+            (self.restaurant_ids[index], chord_to_km(-chord))
+            for chord, index in sorted(found, reverse=True)
+        ]
+
+    def within(self, coordinates, distance):
+        if not self.restaurant_ids:
+            return []
+        point = get_unit_vectors(coordinates)[0]
+        max_chord = km_to_chord(distance)
+        found = []
+
+        def search(node):
+            if node.indices is not None:
+                chords = np.linalg.norm(self.points[node.indices] - point, axis=1)
+                found.extend(
+                    (chord, index)
+                    for index, chord in zip(node.indices, chords)
+                    if chord <= max_chord
+                )
+                return
+            offset = point[node.axis] - node.split
+            if offset <= max_chord:
+                search(node.left)
+            if offset >= -max_chord:
+                search(node.right)
+
+        search(self.root)
+        return [
+            (self.restaurant_ids[index], chord_to_km(chord))
+            for chord, index in sorted(found)
+        ]
+
+
+restaurant_index = None
+restaurant_index_lock = Lock()
+
+
+def get_restaurant_index():
+    # Как и индекс наличия товаров, живёт в памяти процесса: изменения
+    # координат в этом процессе сбрасывают индекс сразу, из других процессов —
+    # по INDEX_TTL.
+    global restaurant_index
+    with restaurant_index_lock:
+        if not restaurant_index or restaurant_index.is_expired():
+            restaurant_index = RestaurantIndex.build()
+        return restaurant_index
+
+
+def reset_restaurant_index():
+    global restaurant_index
+    with restaurant_index_lock:
+        restaurant_index = None
+
+
+def is_restaurant_location(location_id):
+    with restaurant_index_lock:
+        return bool(restaurant_index) and location_id in restaurant_index.location_ids
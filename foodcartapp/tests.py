@@ -0,0 +1,1318 @@
+import gzip
+import json
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+
+import numpy as np
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from geopy.distance import geodesic, great_circle
+from rest_framework.renderers import JSONRenderer
+
+from locations.geohash import encode, get_neighbourhood
+from locations.models import Location, LocationDistance
+from restaurateur.views import (
+    ORDER_EVENTS_SLOT_KEY,
+    format_order_cursor,
+    get_orders_page,
+    parse_order_cursor,
+    stream_order_events
+)
+from . import models
+from .assignment import assign_orders
+from .availability import (
+    get_availability_index,
+    get_orders_candidates,
+    get_stored_orders_candidates,
+    reset_availability_index,
+    update_orders_candidates
+)
+from .catalog import invalidate_catalog
+from .distances import distance_cache, get_locations_distances
+from .fast_serializers import serialize_order, serialize_order_data, validate_order
+from .intake import (
+    JOURNAL_NAME,
+    REJECTED_NAME,
+    SEALED_SUFFIX,
+    append_to_journal,
+    decode_records,
+    drain_journal
+)
+from .models import (
+    CatalogChange,
+    DeliveryZone,
+    IdempotencyKey,
+    Order,
+    OrderChange,
+    OrderItem,
+    Product,
+    Restaurant,
+    RestaurantMenuItem,
+    geocode_queued_orders
+)
+from .routes import plan_routes
+from .serializers import OrderSerializer
+from .spatial import RestaurantIndex, get_restaurant_index, reset_restaurant_index
+from .utils import (
+    get_distance_matrix,
+    get_pairwise_distances,
+    lookup_locations,
+    request_coordinates_batch
+)
+from .views import accepts_gzip
+from .zones import ZoneIndex, is_deliverable, reset_zone_index
+
+
+class DistanceMatrixTest(TestCase):
+    origins = [(55.75, 37.62), (59.94, 30.31), (-33.87, 151.21)]
+    destinations = [(55.76, 37.63), (40.71, -74.01)]
+
+    def test_matches_geodesic(self):
+        distances = get_distance_matrix(self.origins, self.destinations)
+
+        self.assertEqual(distances.shape, (3, 2))
+        for row, origin in enumerate(self.origins):
+            for column, destination in enumerate(self.destinations):
+                self.assertAlmostEqual(
+                    distances[row, column],
+                    geodesic(origin, destination).km,
+                    delta=0.1
+                )
+
+    def test_spherical_distances(self):
+        distances = get_distance_matrix(self.origins, self.destinations, ellipsoidal=False)
+
+        self.assertAlmostEqual(
+            distances[0, 1],
+            great_circle(self.origins[0], self.destinations[1]).km,
+            delta=0.01
+        )
+
+    def test_pairwise_distances_match_matrix_diagonal(self):
+        points = self.origins[:2]
+
+        pairwise_distances = get_pairwise_distances(points, self.destinations)
+
+        np.testing.assert_allclose(
+            pairwise_distances,
+            np.diag(get_distance_matrix(points, self.destinations))
+        )
+
+    def test_zero_distance(self):
+        self.assertEqual(get_distance_matrix([(55.75, 37.62)], [(55.75, 37.62)])[0, 0], 0)
+
+    def test_empty_matrix(self):
+        self.assertEqual(get_distance_matrix([], self.destinations).shape, (0, 2))
+
+
+class RequestCoordinatesBatchTest(TestCase):
+    @patch('foodcartapp.utils.request_coordinates')
+    def test_skips_failed_requests(self, request_coordinates):
+        def request(address, apikey):
+            if address == 'таймаут':
+                raise requests.exceptions.Timeout()
+            return None if address == 'нигде' else ('37.61', '55.76')
+        request_coordinates.side_effect = request
+
+        found_coordinates = request_coordinates_batch(['москва', 'нигде', 'таймаут', 'москва'])
+
+        self.assertEqual(found_coordinates, {'москва': ('37.61', '55.76'), 'нигде': None})
+        self.assertEqual(request_coordinates.call_count, 3)
+
+    @patch('foodcartapp.utils.request_coordinates_batch')
+    def test_lookup_requests_each_address_once(self, request_coordinates_batch):
+        request_coordinates_batch.return_value = {}
+
+        lookup_locations(['Москва', 'москва', 'Питер'])
+
+        self.assertEqual(len(list(request_coordinates_batch.call_args.args[0])), 2)
+
+
+@patch('foodcartapp.utils.request_coordinates_batch')
+class LookupLocationsTest(TestCase):
+    def test_reuses_location_for_normalized_address(self, request_coordinates_batch):
+        request_coordinates_batch.return_value = {'Москва, Тверская 1': ('37.61', '55.76')}
+        location = lookup_locations(['Москва, Тверская 1'])['Москва, Тверская 1']
+
+        request_coordinates_batch.return_value = {}
+        cached_location = lookup_locations([' москва,  ТВЕРСКАЯ 1'])[' москва,  ТВЕРСКАЯ 1']
+
+        self.assertEqual(location.address, 'москва, тверская 1')
+        self.assertEqual(location.get_coordinates(), (55.76, 37.61))
+        self.assertEqual(cached_location, location)
+        self.assertEqual(list(request_coordinates_batch.call_args.args[0]), [])
+
+    def test_caches_not_found_address(self, request_coordinates_batch):
+        request_coordinates_batch.return_value = {'нигде': None}
+
+        location = lookup_locations(['нигде'])['нигде']
+
+        self.assertFalse(location.is_found())
+        self.assertTrue(Location.objects.filter(address='нигде').exists())
+
+    def test_skips_geocoder_errors(self, request_coordinates_batch):
+        request_coordinates_batch.return_value = {}
+
+        self.assertIsNone(lookup_locations(['Москва'])['Москва'])
+        self.assertFalse(Location.objects.exists())
+
+    def test_refreshes_stale_location(self, request_coordinates_batch):
+        Location.objects.create(
+            address='москва',
+            lat=1,
+            lon=1,
+            updated=timezone.now() - timedelta(days=365),
+        )
+        request_coordinates_batch.return_value = {'Москва': ('37.61', '55.76')}
+
+        location = lookup_locations(['Москва'])['Москва']
+
+        self.assertEqual(location.get_coordinates(), (55.76, 37.61))
+        self.assertFalse(location.is_stale())
+
+    def test_keeps_stale_location_on_geocoder_error(self, request_coordinates_batch):
+        stale_location = Location.objects.create(
+            address='москва',
+            lat=1,
+            lon=1,
+            updated=timezone.now() - timedelta(days=365),
+        )
+        request_coordinates_batch.return_value = {}
+
+        location = lookup_locations(['Москва'])['Москва']
+
+        self.assertEqual(location, stale_location)
+        self.assertEqual(location.get_coordinates(), (1, 1))
+
+
+@patch('foodcartapp.utils.request_coordinates_batch')
+class GeocodeInBackgroundTest(TestCase):
+    def create_order(self, address):
+        return Order.objects.create(firstname='Иван', phonenumber='+79161234567', address=address)
+
+    def test_geocodes_queued_orders_in_one_batch(self, request_coordinates_batch):
+        found_order, not_found_order = self.create_order('Москва'), self.create_order('Нигде')
+        request_coordinates_batch.return_value = {'Москва': ('37.61', '55.76'), 'Нигде': None}
+
+        with patch.object(models, 'geocoding_executor') as geocoding_executor:
+            Order.objects.filter(pk=found_order.pk).geocode_in_background()
+            Order.objects.filter(pk=not_found_order.pk).geocode_in_background()
+            geocode_queued_orders()
+
+        geocoding_executor.submit.assert_called_once()
+        request_coordinates_batch.assert_called_once()
+        found_order.refresh_from_db()
+        not_found_order.refresh_from_db()
+        self.assertEqual(found_order.geocoding_status, Order.GEOCODED)
+        self.assertEqual(not_found_order.geocoding_status, Order.NOT_FOUND)
+        self.assertFalse(models.is_geocoding_scheduled)
+
+
+class CatalogResponseTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        RestaurantMenuItem.objects.create(
+            restaurant=Restaurant.objects.create(name='Рядом'),
+            product=self.burger
+        )
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip('gzip, deflate'))
+        self.assertTrue(accepts_gzip('br;q=1.0, GZIP;q=0.5'))
+        self.assertTrue(accepts_gzip('*'))
+        self.assertFalse(accepts_gzip(''))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('*, gzip;q=0'))
+        self.assertFalse(accepts_gzip('identity'))
+
+    def test_serves_gzip_only_when_accepted(self):
+        response = self.client.get('/api/products/')
+        gzip_response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip')
+        refused_response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+
+        self.assertEqual(gzip_response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzip_response.content), response.content)
+        self.assertNotIn('Content-Encoding', refused_response)
+        self.assertNotEqual(gzip_response['ETag'], response['ETag'])
+
+    def test_not_modified_by_etag(self):
+        response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip')
+
+        not_modified_response = self.client.get(
+            '/api/products/',
+            HTTP_ACCEPT_ENCODING='gzip',
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+
+        self.assertEqual(not_modified_response.status_code, 304)
+        self.assertEqual(not_modified_response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_last_modified_survives_cache_expiry(self):
+        response = self.client.get('/api/products/')
+        invalidate_catalog()
+
+        not_modified_response = self.client.get(
+            '/api/products/',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+
+        self.assertEqual(not_modified_response.status_code, 304)
+
+    def test_product_change_updates_catalog(self):
+        response = self.client.get('/api/products/')
+        self.burger.name = 'Чизбургер'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.burger.save()
+
+        changed_response = self.client.get(
+            '/api/products/',
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+
+        self.assertEqual(changed_response.status_code, 200)
+        self.assertEqual(changed_response.json()[0]['name'], 'Чизбургер')
+
+
+class CatalogChangesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(name='Рядом')
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.fries = Product.objects.create(name='Картошка', price=50, image='fries.jpg')
+        self.fries_item = RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=self.fries)
+        RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=self.burger)
+        self.token = CatalogChange.objects.get_latest_token()
+        CatalogChange.objects.update(changed_at=timezone.now() - timedelta(days=1))
+
+    def get_changes(self, since):
+        return self.client.get('/api/products/', {'since': since}).json()
+
+    def test_full_sync_for_bad_tokens(self):
+        for since in [0, -1, 'бургер', self.token + 1]:
+            changes = self.get_changes(since)
+
+            self.assertTrue(changes['full'])
+            self.assertEqual(changes['token'], self.token)
+            self.assertCountEqual(
+                [product['id'] for product in changes['products']],
+                [self.burger.id, self.fries.id]
+            )
+
+    def test_delta_sync(self):
+        self.burger.name = 'Чизбургер'
+        self.burger.save()
+        self.fries_item.availability = False
+        self.fries_item.save()
+
+        changes = self.get_changes(self.token)
+
+        self.assertFalse(changes['full'])
+        self.assertEqual(changes['token'], CatalogChange.objects.get_latest_token())
+        self.assertEqual([product['name'] for product in changes['products']], ['Чизбургер'])
+        self.assertEqual(changes['removed'], [self.fries.id])
+
+    def test_restaurant_changes_only_with_name(self):
+        self.restaurant.address = 'Москва'
+        with patch('foodcartapp.signals.invalidate_catalog') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.restaurant.save()
+            self.assertFalse(invalidate.called)
+            self.assertEqual(CatalogChange.objects.get_latest_token(), self.token)
+
+            self.restaurant.name = 'Совсем рядом'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.restaurant.save()
+            self.assertTrue(invalidate.called)
+
+        changes = self.get_changes(self.token)
+        self.assertCountEqual(
+            [product['id'] for product in changes['products']],
+            [self.burger.id, self.fries.id]
+        )
+
+    def test_no_changes(self):
+        changes = self.get_changes(self.token)
+
+        self.assertFalse(changes['full'])
+        self.assertEqual(changes['products'], [])
+        self.assertEqual(changes['removed'], [])
+
+    def test_rereads_changes_committed_late(self):
+        # Изменение с меньшим id, ставшее видно после того, как клиент
+        # прочитал токен.
+        self.burger.save()
+        token = CatalogChange.objects.get_latest_token()
+        CatalogChange.objects.filter(id=token).update(changed_at=timezone.now() - timedelta(days=1))
+        CatalogChange.objects.filter(product_id=self.fries.id).update(changed_at=timezone.now())
+
+        changes = self.get_changes(token)
+
+        self.assertEqual([product['id'] for product in changes['products']], [self.fries.id])
+
+    def test_full_sync_after_purge(self):
+        self.burger.save()
+        CatalogChange.objects.filter(id__lte=self.token).delete()
+
+        self.assertTrue(self.get_changes(self.token - 1)['full'])
+        self.assertFalse(self.get_changes(self.token)['full'])
+
+
+class ProductListTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(name='Рядом')
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=self.burger)
+
+    def test_serves_compact_catalog_by_default(self):
+        response = self.client.get('/api/products/')
+        pretty_response = self.client.get('/api/products/', {'pretty': 1})
+
+        self.assertNotIn(b'\n', response.content)
+        self.assertIn(b'\n', pretty_response.content)
+        self.assertEqual(response.json(), pretty_response.json())
+
+    def test_lists_product_restaurants(self):
+        product = self.client.get('/api/products/').json()[0]
+
+        self.assertEqual(product['restaurants'], [{'id': self.restaurant.id, 'name': 'Рядом'}])
+
+    def test_restaurant_rename_rebuilds_catalog(self):
+        self.client.get('/api/products/')
+        self.restaurant.name = 'Далеко'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.save()
+
+        product = self.client.get('/api/products/').json()[0]
+
+        self.assertEqual(product['restaurants'][0]['name'], 'Далеко')
+
+
+class AvailabilityIndexTest(TestCase):
+    def setUp(self):
+        reset_availability_index()
+        self.first_restaurant = Restaurant.objects.create(name='Первый')
+        self.second_restaurant = Restaurant.objects.create(name='Второй')
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.fries = Product.objects.create(name='Картошка', price=50, image='fries.jpg')
+        for restaurant in [self.first_restaurant, self.second_restaurant]:
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.burger)
+        self.fries_item = RestaurantMenuItem.objects.create(
+            restaurant=self.second_restaurant,
+            product=self.fries
+        )
+
+    def test_intersects_product_restaurants(self):
+        availability_index = get_availability_index()
+
+        self.assertCountEqual(
+            availability_index.get_restaurant_ids([self.burger.id]),
+            [self.first_restaurant.id, self.second_restaurant.id]
+        )
+        self.assertEqual(
+            availability_index.get_restaurant_ids([self.burger.id, self.fries.id]),
+            [self.second_restaurant.id]
+        )
+        self.assertEqual(availability_index.get_restaurant_ids([]), [])
+        self.assertEqual(availability_index.get_restaurant_ids([self.burger.id, 0]), [])
+
+    def test_refreshes_products_after_commit(self):
+        availability_index = get_availability_index()
+        self.fries_item.availability = False
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fries_item.save()
+
+        self.assertEqual(availability_index.get_restaurant_ids([self.fries.id]), [])
+
+    def test_ignores_rolled_back_menu_changes(self):
+        availability_index = get_availability_index()
+        self.fries_item.availability = False
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.fries_item.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+        self.assertEqual(
+            availability_index.get_restaurant_ids([self.fries.id]),
+            [self.second_restaurant.id]
+        )
+
+
+class OrderTotalTest(TestCase):
+    def setUp(self):
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.fries = Product.objects.create(name='Картошка', price=50, image='fries.jpg')
+
+    def create_order(self, product_items):
+        serializer = OrderSerializer(data={
+            'products': [
+                {'product': product.id, 'quantity': quantity}
+                for product, quantity in product_items
+            ],
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва',
+        })
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_order_total_is_stored_on_create(self):
+        order = self.create_order([(self.burger, 2), (self.fries, 3)])
+
+        self.assertEqual(Order.objects.get(pk=order.pk).total, 350)
+
+    def test_update_totals(self):
+        order = self.create_order([(self.burger, 2), (self.fries, 3)])
+        empty_order = self.create_order([(self.burger, 1)])
+        OrderItem.objects.filter(order=order, product=self.fries).update(quantity=1)
+        OrderItem.objects.filter(order=empty_order).delete()
+
+        Order.objects.update_totals()
+
+        self.assertEqual(Order.objects.get(pk=order.pk).total, 250)
+        self.assertEqual(Order.objects.get(pk=empty_order.pk).total, 0)
+
+    def test_update_total(self):
+        order = self.create_order([(self.burger, 1)])
+        OrderItem.objects.create(order=order, product=self.fries, price=40, quantity=2)
+
+        order.update_total()
+
+        self.assertEqual(Order.objects.get(pk=order.pk).total, 180)
+
+
+class OrderSerializerTest(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Товар {number}', price=number + 1, image='burger.jpg')
+            for number in range(15)
+        ]
+        self.order_params = {
+            'products': [{'product': product.id, 'quantity': 2} for product in self.products],
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва',
+        }
+
+    def test_fetches_products_in_one_query(self):
+        serializer = OrderSerializer(data=self.order_params)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+
+    def test_inserts_items_in_bulk(self):
+        serializer = OrderSerializer(data=self.order_params)
+        serializer.is_valid(raise_exception=True)
+
+        with self.assertNumQueries(3):
+            order = serializer.save()
+
+        self.assertEqual(
+            list(order.order_items.order_by('product_id').values_list('price', 'quantity')),
+            [(product.price, 2) for product in self.products]
+        )
+
+    def test_reports_bad_product_ids(self):
+        self.order_params['products'] = [
+            {'product': 0, 'quantity': 1},
+            {'product': 'бургер', 'quantity': 1},
+            {'product': True, 'quantity': 1},
+        ]
+        serializer = OrderSerializer(data=self.order_params)
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(
+            [errors['product'][0].code for errors in serializer.errors['products']],
+            ['does_not_exist', 'incorrect_type', 'incorrect_type']
+        )
+
+
+class RestaurantIndexTest(TestCase):
+    def setUp(self):
+        random = np.random.default_rng(11)
+        self.coordinates = np.column_stack([
+            random.uniform(55.5, 56, 200),
+            random.uniform(37.3, 37.9, 200),
+        ])
+        self.restaurant_ids = list(range(1, 201))
+        self.index = RestaurantIndex(self.restaurant_ids, self.coordinates)
+        self.points = [(55.75, 37.62), (55.5, 37.3), (56.2, 38.1)]
+
+    def get_distances(self, point):
+        return get_distance_matrix([point], self.coordinates, ellipsoidal=False)[0]
+
+    def test_nearest_matches_brute_force(self):
+        for point in self.points:
+            distances = self.get_distances(point)
+
+            nearest = self.index.nearest(point, 5)
+
+            self.assertEqual(
+                [restaurant_id for restaurant_id, _ in nearest],
+                [self.restaurant_ids[index] for index in np.argsort(distances)[:5]]
+            )
+            np.testing.assert_allclose(
+                [distance for _, distance in nearest],
+                np.sort(distances)[:5]
+            )
+
+    def test_nearest_among_restaurants(self):
+        allowed_ids = set(self.restaurant_ids[::7])
+        for point in self.points:
+            distances = self.get_distances(point)
+            expected_ids = [
+                self.restaurant_ids[index] for index in np.argsort(distances)
+                if self.restaurant_ids[index] in allowed_ids
+            ][:3]
+
+            nearest = self.index.nearest(point, 3, allowed_ids)
+
+            self.assertEqual([restaurant_id for restaurant_id, _ in nearest], expected_ids)
+
+    def test_within_matches_brute_force(self):
+        for point in self.points:
+            distances = self.get_distances(point)
+
+            within = self.index.within(point, 5)
+
+            self.assertEqual(
+                [restaurant_id for restaurant_id, _ in within],
+                [self.restaurant_ids[index] for index in np.argsort(distances) if distances[index] <= 5]
+            )
+
+    def test_empty_index(self):
+        index = RestaurantIndex([], np.empty((0, 2)))
+
+        self.assertEqual(index.nearest((55.75, 37.62)), [])
+        self.assertEqual(index.within((55.75, 37.62), 5), [])
+
+
+class GeohashTest(TestCase):
+    def test_encode(self):
+        self.assertEqual(encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(encode(-33.8688, 151.2093, 5), 'r3gx2')
+
+    def test_neighbourhood_wraps_antimeridian(self):
+        neighbourhood = get_neighbourhood(0, 179.99, 3)
+
+        self.assertEqual(len(neighbourhood), 9)
+        self.assertIn(encode(0, -179.99, 3), neighbourhood)
+
+    def test_around_matches_brute_force(self):
+        random = np.random.default_rng(12)
+        coordinates = np.column_stack([
+            random.uniform(55.5, 56, 300),
+            random.uniform(37.3, 37.9, 300),
+        ])
+        Location.objects.bulk_create([
+            Location(address=f'точка {number}', lat=lat, lon=lon, geohash=encode(lat, lon))
+            for number, (lat, lon) in enumerate(coordinates)
+        ])
+        center = (55.75, 37.62)
+        distances = get_distance_matrix([center], coordinates, ellipsoidal=False)[0]
+
+        for distance in [1, 5, 15]:
+            found_addresses = set(
+                Location.objects.around(*center, distance).values_list('address', flat=True)
+            )
+            near_addresses = {
+                f'точка {number}' for number in np.flatnonzero(distances <= distance)
+            }
+            self.assertLessEqual(near_addresses, found_addresses)
+            self.assertLess(len(found_addresses), len(coordinates))
+
+    def test_geohash_follows_coordinates(self):
+        location = Location.objects.create(address='москва', lat=55.75, lon=37.62)
+        location.lat, location.lon = None, None
+        location.save(update_fields=['lat', 'lon'])
+
+        location.refresh_from_db()
+        self.assertEqual(location.geohash, '')
+
+
+class LocationsDistancesTest(TestCase):
+    def setUp(self):
+        distance_cache.clear()
+        self.origin = Location.objects.create(address='откуда', lat=55.75, lon=37.62)
+        self.destination = Location.objects.create(address='куда', lat=55.6, lon=37.4)
+
+    def get_distance(self):
+        distances = get_locations_distances([(self.origin, self.destination)])
+        return distances[(self.origin.id, self.destination.id)]
+
+    def test_matches_distance_matrix(self):
+        self.assertAlmostEqual(
+            self.get_distance(),
+            get_distance_matrix([self.origin.get_coordinates()], [self.destination.get_coordinates()])[0, 0]
+        )
+
+    def test_caches_distances_in_memory(self):
+        distance = self.get_distance()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_distance(), distance)
+        self.assertFalse(LocationDistance.objects.exists())
+
+    def test_recalculates_moved_location(self):
+        distance = self.get_distance()
+        self.destination.lat = 55.7
+
+        self.assertLess(self.get_distance(), distance)
+
+    @override_settings(DISTANCE_CACHE_PERSISTENT=True)
+    def test_stores_distances(self):
+        distance = self.get_distance()
+        distance_cache.clear()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_distance(), distance)
+        self.assertEqual(LocationDistance.objects.get().distance, distance)
+
+    @override_settings(DISTANCE_CACHE_PERSISTENT=True)
+    def test_drops_stored_distances_of_moved_location(self):
+        self.get_distance()
+        self.origin.updated = timezone.now()
+        self.origin.save()
+        self.assertTrue(LocationDistance.objects.exists())
+
+        self.origin.lat = 55.7
+        self.origin.save()
+
+        self.assertFalse(LocationDistance.objects.exists())
+
+
+@patch('restaurateur.views.ORDERS_PAGE_SIZE', 2)
+class OrdersPageTest(TestCase):
+    def setUp(self):
+        registered_at = timezone.now()
+        # Заказы с одинаковым временем различаются только id.
+        for minutes in [0, 0, 0, 1, 2]:
+            Order.objects.create(
+                firstname='Иван',
+                phonenumber='+79161234567',
+                address='Москва',
+                registered_at=registered_at + timedelta(minutes=minutes),
+            )
+        self.order_ids = list(Order.objects.order_by('registered_at', 'id').values_list('id', flat=True))
+
+    def test_pages_forward_and_back(self):
+        pages, after = [], None
+        while True:
+            page, has_previous, has_next = get_orders_page(Order.objects.all(), after=after)
+            pages.append([order.id for order in page])
+            self.assertEqual(has_previous, bool(after))
+            if not has_next:
+                break
+            after = parse_order_cursor(format_order_cursor(page[-1]))
+        self.assertEqual(pages, [self.order_ids[0:2], self.order_ids[2:4], self.order_ids[4:]])
+
+        before = parse_order_cursor(format_order_cursor(Order.objects.get(pk=self.order_ids[4])))
+        page, has_previous, has_next = get_orders_page(Order.objects.all(), before=before)
+        self.assertEqual([order.id for order in page], self.order_ids[2:4])
+        self.assertTrue(has_previous)
+        self.assertTrue(has_next)
+
+    def test_page_does_not_shift_on_new_orders(self):
+        page, _, _ = get_orders_page(Order.objects.all())
+        after = parse_order_cursor(format_order_cursor(page[-1]))
+        Order.objects.create(
+            firstname='Иван',
+            phonenumber='+79161234567',
+            address='Москва',
+            registered_at=timezone.now() - timedelta(days=1),
+        )
+
+        page, _, _ = get_orders_page(Order.objects.all(), after=after)
+
+        self.assertEqual([order.id for order in page], self.order_ids[2:4])
+
+    def test_bad_cursor(self):
+        for cursor in [None, '', 'заказ', '2024-01-01_id']:
+            self.assertIsNone(parse_order_cursor(cursor))
+
+
+@override_settings(ORDER_EVENTS_STREAM_SECONDS=0.2, ORDER_EVENTS_POLL_SECONDS=0.05)
+class OrderEventsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.orders = [
+            Order.objects.create(firstname='Иван', phonenumber='+79161234567', address='Москва')
+            for _ in range(2)
+        ]
+        self.last_change_id = OrderChange.objects.get_latest_id()
+        OrderChange.objects.update(changed_at=timezone.now() - timedelta(days=1))
+
+    def get_events(self, last_change_id):
+        events = []
+        for message in stream_order_events({}, last_change_id):
+            fields = dict(
+                line.split(': ', 1) for line in message.strip().split('\n')
+            )
+            if 'event' in fields:
+                events.append((int(fields['id']), fields['event'], json.loads(fields['data'])['id']))
+        return events
+
+    def test_each_change_has_own_event_id(self):
+        first_order, second_order = self.orders
+        OrderChange.objects.record([first_order.id, second_order.id, first_order.id])
+        change_ids = list(
+            OrderChange.objects.filter(id__gt=self.last_change_id)
+                               .order_by('id')
+                               .values_list('id', flat=True)
+        )
+        second_order.status = Order.RECEIVED
+        Order.objects.bulk_update([second_order], ['status'])
+
+        events = self.get_events(self.last_change_id)
+
+        self.assertEqual(events, [
+            (change_ids[1], 'remove', second_order.id),
+            (change_ids[2], 'upsert', first_order.id),
+        ])
+
+    def test_sends_changes_committed_late_once(self):
+        first_order, second_order = self.orders
+        OrderChange.objects.record([first_order.id])
+        last_change_id = OrderChange.objects.get_latest_id()
+        OrderChange.objects.filter(id=last_change_id).update(changed_at=timezone.now() - timedelta(days=1))
+        # Изменение с меньшим id, ставшее видно после того, как поток его прошёл.
+        OrderChange.objects.filter(order_id=second_order.id).update(changed_at=timezone.now())
+
+        events = self.get_events(last_change_id)
+
+        self.assertEqual([order_id for _, _, order_id in events], [second_order.id])
+
+    def test_limits_open_streams(self):
+        manager = User.objects.create(username='manager', is_staff=True)
+        self.client.force_login(manager)
+        with self.settings(ORDER_EVENTS_MAX_STREAMS=1):
+            response = self.client.get('/manager/orders/events/')
+            self.assertTrue(cache.get(ORDER_EVENTS_SLOT_KEY.format(slot=0)))
+            b''.join(response.streaming_content)
+            self.assertIsNone(cache.get(ORDER_EVENTS_SLOT_KEY.format(slot=0)))
+
+            cache.add(ORDER_EVENTS_SLOT_KEY.format(slot=0), True)
+            response = self.client.get('/manager/orders/events/')
+            content = b''.join(response.streaming_content)
+
+        self.assertEqual(content, b'retry: 200\n\n')
+
+
+class OrdersCandidatesTest(TestCase):
+    def setUp(self):
+        reset_availability_index()
+        reset_restaurant_index()
+        self.near_restaurant = Restaurant.objects.create(
+            name='Рядом',
+            coordinates=Location.objects.create(address='рядом', lat=55.75, lon=37.62),
+        )
+        self.far_restaurant = Restaurant.objects.create(
+            name='Далеко',
+            coordinates=Location.objects.create(address='далеко', lat=55.6, lon=37.4),
+        )
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.fries = Product.objects.create(name='Картошка', price=50, image='fries.jpg')
+        for restaurant in [self.near_restaurant, self.far_restaurant]:
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.burger)
+        RestaurantMenuItem.objects.create(restaurant=self.far_restaurant, product=self.fries)
+        self.order_location = Location.objects.create(address='клиент', lat=55.76, lon=37.63)
+
+    def create_orders(self, count, products):
+        for _ in range(count):
+            order = Order.objects.create(
+                firstname='Иван',
+                phonenumber='+79161234567',
+                address='клиент',
+                location=self.order_location,
+                geocoding_status=Order.GEOCODED,
+            )
+            for product in products:
+                OrderItem.objects.create(
+                    order=order,
+                    product=product,
+                    price=product.price,
+                    quantity=1,
+                )
+
+    def test_candidates_sorted_by_distance(self):
+        self.create_orders(1, [self.burger])
+        order = Order.objects.get()
+
+        candidates = get_orders_candidates(Order.objects.select_related('location'))
+
+        restaurants = [candidate.restaurant for candidate in candidates[order.id]]
+        self.assertEqual(restaurants, [self.near_restaurant, self.far_restaurant])
+        self.assertLess(candidates[order.id][0].distance, 2)
+
+    def test_only_restaurants_with_whole_order(self):
+        self.create_orders(1, [self.burger, self.fries])
+        order = Order.objects.get()
+
+        candidates = get_orders_candidates(Order.objects.select_related('location'))
+
+        restaurants = [candidate.restaurant for candidate in candidates[order.id]]
+        self.assertEqual(restaurants, [self.far_restaurant])
+
+    @override_settings(ORDER_CANDIDATES_COUNT=1)
+    def test_only_nearest_candidates(self):
+        self.create_orders(1, [self.burger])
+        order = Order.objects.get()
+
+        candidates = get_orders_candidates(Order.objects.select_related('location'))
+
+        restaurants = [candidate.restaurant for candidate in candidates[order.id]]
+        self.assertEqual(restaurants, [self.near_restaurant])
+
+    def test_query_count_does_not_depend_on_orders_count(self):
+        get_availability_index()
+        get_restaurant_index()
+        for orders_count in [1, 20]:
+            self.create_orders(orders_count, [self.burger, self.fries])
+            with self.assertNumQueries(3):
+                candidates = get_orders_candidates(
+                    Order.objects.select_related('location')
+                )
+            self.assertEqual(len(candidates), Order.objects.count())
+
+    def test_stored_candidates_follow_menu_availability(self):
+        self.create_orders(1, [self.burger])
+        order = Order.objects.select_related('location').get()
+        update_orders_candidates([order])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.filter(restaurant=self.near_restaurant)\
+                                      .get()\
+                                      .delete()
+
+        candidates = get_stored_orders_candidates([order])
+        restaurants = [candidate.restaurant for candidate in candidates[order.id]]
+        self.assertEqual(restaurants, [self.far_restaurant])
+
+    @override_settings(ORDER_CANDIDATES_COUNT=1)
+    def test_stored_candidates_follow_restaurant_location(self):
+        self.create_orders(1, [self.burger])
+        order = Order.objects.select_related('location').get()
+        update_orders_candidates([order])
+
+        location = self.near_restaurant.coordinates
+        location.lat, location.lon = 55.5, 37.3
+        with self.captureOnCommitCallbacks(execute=True):
+            location.save()
+
+        candidates = get_stored_orders_candidates([order])
+        restaurants = [candidate.restaurant for candidate in candidates[order.id]]
+        self.assertEqual(restaurants, [self.far_restaurant])
+
+    @override_settings(ORDER_CANDIDATES_COUNT=1)
+    def test_stored_candidates_follow_restaurant_coordinates(self):
+        self.create_orders(1, [self.burger])
+        order = Order.objects.select_related('location').get()
+        update_orders_candidates([order])
+
+        self.far_restaurant.coordinates = Location.objects.create(
+            address='совсем рядом',
+            lat=55.76,
+            lon=37.63,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far_restaurant.save()
+
+        candidates = get_stored_orders_candidates([order])
+        restaurants = [candidate.restaurant for candidate in candidates[order.id]]
+        self.assertEqual(restaurants, [self.far_restaurant])
+
+
+class AssignOrdersTest(TestCase):
+    def test_moves_assigned_order_to_free_place(self):
+        distances = [
+            [1, 2],
+            [1, 10],
+        ]
+
+        assignment = assign_orders(distances, [1, 1])
+
+        self.assertEqual(list(assignment), [1, 0])
+
+    def test_skips_orders_without_free_places(self):
+        distances = [
+            [1, np.inf],
+            [2, np.inf],
+            [np.inf, np.inf],
+        ]
+
+        assignment = assign_orders(distances, [1, 1])
+
+        self.assertEqual(list(assignment), [0, -1, -1])
+
+
+class RestaurantLoadTest(TestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name='Рядом')
+        self.order = Order.objects.create(
+            firstname='Иван',
+            phonenumber='+79161234567',
+            address='клиент',
+        )
+
+    def assertLoads(self, kitchen_load, delivery_load):
+        self.restaurant.refresh_from_db()
+        self.assertEqual(
+            (self.restaurant.kitchen_load, self.restaurant.delivery_load),
+            (kitchen_load, delivery_load)
+        )
+
+    def test_loads_follow_order_status(self):
+        self.order.restaurant = self.restaurant
+        self.order.save()
+        self.assertLoads(1, 0)
+
+        self.order.status = Order.IN_DELIVERY
+        self.order.save()
+        self.assertLoads(0, 1)
+
+        self.order.status = Order.RECEIVED
+        self.order.save()
+        self.assertLoads(0, 0)
+
+    def test_update_loads_matches_counters(self):
+        self.order.restaurant = self.restaurant
+        self.order.save()
+        Restaurant.objects.update(kitchen_load=5, delivery_load=5)
+
+        Restaurant.objects.update_loads()
+
+        self.assertLoads(1, 0)
+
+
+class ZoneIndexTest(TestCase):
+    def test_finds_restaurants_covering_point(self):
+        # Вторая зона — «подкова»: точка в её вырезе внутри описанного
+        # прямоугольника, но вне самой зоны.
+        zone_index = ZoneIndex([
+            (1, [[55.7, 37.5], [55.8, 37.5], [55.8, 37.7], [55.7, 37.7]]),
+            (2, [
+                [55.7, 37.6], [55.9, 37.6], [55.9, 37.8], [55.7, 37.8],
+                [55.7, 37.75], [55.85, 37.75], [55.85, 37.65], [55.7, 37.65],
+            ]),
+        ])
+
+        self.assertEqual(zone_index.get_restaurant_ids(55.75, 37.62), {1, 2})
+        self.assertEqual(zone_index.get_restaurant_ids(55.75, 37.68), {1})
+        self.assertEqual(zone_index.get_restaurant_ids(55.75, 37.72), set())
+        self.assertEqual(zone_index.get_restaurant_ids(55.88, 37.7), {2})
+
+    def test_restaurants_without_zones_deliver_anywhere(self):
+        zone_index = ZoneIndex(
+            [(1, [[55.7, 37.5], [55.8, 37.5], [55.8, 37.7], [55.7, 37.7]])],
+            [3]
+        )
+
+        self.assertEqual(zone_index.get_restaurant_ids(55.75, 37.62), {1, 3})
+        self.assertEqual(zone_index.get_restaurant_ids(59.9, 30.3), {3})
+
+    def test_large_and_broken_zones(self):
+        zone_index = ZoneIndex([
+            (1, [[-80, -170], [80, -170], [80, 170], [-80, 170]]),
+            (2, [[55.7, 37.5], [55.8, 37.5]]),
+            (3, 'не многоугольник'),
+        ])
+
+        self.assertEqual(zone_index.cells, {})
+        self.assertEqual(zone_index.get_restaurant_ids(55.75, 37.62), {1})
+
+    def test_is_deliverable_with_partial_zones(self):
+        reset_zone_index()
+        self.addCleanup(reset_zone_index)
+        zoned_restaurant = Restaurant.objects.create(name='С зоной')
+        DeliveryZone.objects.create(
+            restaurant=zoned_restaurant,
+            polygon=[[55.7, 37.5], [55.8, 37.5], [55.8, 37.7], [55.7, 37.7]],
+        )
+        location = Location.objects.create(address='питер', lat=59.9, lon=30.3)
+        self.assertFalse(is_deliverable(location))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Restaurant.objects.create(name='Без зоны')
+
+        self.assertTrue(is_deliverable(location))
+
+
+class PlanRoutesTest(TestCase):
+    def test_routes_visit_every_order_once_in_short_order(self):
+        # Ресторан в начале прямой, заказы разбросаны по ней в случайном порядке.
+        positions = [0, 5, 1, 7, 3, 2, 6, 4]
+        distances = np.abs(np.subtract.outer(positions, positions)).astype(float)
+
+        routes = plan_routes(distances, stops_count=4)
+
+        self.assertEqual(
+            [[positions[point] for point in route] for route in routes],
+            [[1, 2, 3, 4], [5, 6, 7]]
+        )
+
+
+class RegisterOrderTest(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.order_params = {
+            'products': [{'product': product.id, 'quantity': 1}],
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва',
+        }
+
+    def post_order(self, key):
+        return self.client.post(
+            '/api/order/',
+            self.order_params,
+            content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replays_response_for_same_key(self):
+        response = self.post_order('checkout-1')
+        replayed_response = self.post_order('checkout-1')
+
+        self.assertEqual(replayed_response.content, response.content)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_rejects_same_key_for_another_order(self):
+        self.post_order('checkout-1')
+        self.order_params['address'] = 'Санкт-Петербург'
+
+        response = self.post_order('checkout-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_batch_reports_each_order(self):
+        invalid_order_params = {**self.order_params, 'phonenumber': '123'}
+
+        response = self.client.post(
+            '/api/orders/batch/',
+            [self.order_params, invalid_order_params],
+            content_type='application/json',
+        )
+
+        created, failed = response.json()
+        self.assertEqual(created['status'], 'created')
+        self.assertEqual(created['order']['id'], Order.objects.get().id)
+        self.assertEqual(failed['status'], 'error')
+        self.assertIn('phonenumber', failed['errors'])
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_batch_reports_orders_failing_on_insert(self):
+        duplicate_order_params = {
+            **self.order_params,
+            'products': self.order_params['products'] * 2,
+        }
+        order_params_without_lastname = {
+            key: value for key, value in self.order_params.items() if key != 'lastname'
+        }
+
+        response = self.client.post(
+            '/api/orders/batch/',
+            [self.order_params, duplicate_order_params, order_params_without_lastname],
+            content_type='application/json',
+        )
+
+        created, failed, created_without_lastname = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(created['status'], 'created')
+        self.assertEqual(failed['status'], 'error')
+        self.assertIn('products', failed['errors'])
+        self.assertEqual(created_without_lastname['status'], 'created')
+        self.assertEqual(
+            Order.objects.get(id=created_without_lastname['order']['id']).lastname,
+            ''
+        )
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+    def test_journaled_orders_are_saved_once(self):
+        with tempfile.TemporaryDirectory() as journal_dir,\
+                self.settings(ORDER_INTAKE_JOURNAL_DIR=journal_dir):
+            response = self.client.post(
+                '/api/order/',
+                self.order_params,
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertFalse(Order.objects.exists())
+
+            # Упавший воркер оставил запечатанный сегмент с уже перенесённой
+            # записью и недописанной строкой.
+            with open(os.path.join(journal_dir, JOURNAL_NAME), 'rb') as journal:
+                content = journal.read()
+            drain_journal()
+            with open(os.path.join(journal_dir, f'0{SEALED_SUFFIX}'), 'wb') as segment:
+                segment.write(content + b'0000 {"intake_id"')
+            orders, broken_count, rejected_count = drain_journal()
+
+        self.assertEqual((orders, broken_count, rejected_count), ([], 1, 0))
+        order = Order.objects.get()
+        self.assertEqual(str(order.intake_id), response.json()['intake_id'])
+        self.assertEqual(order.total, 100)
+        self.assertEqual(OrderItem.objects.get().order, order)
+
+    def test_journaled_order_with_taken_key_is_not_journaled(self):
+        with tempfile.TemporaryDirectory() as journal_dir,\
+                self.settings(ORDER_INTAKE_JOURNAL_DIR=journal_dir):
+            response = self.post_order('checkout-1')
+            # Параллельный запрос занял ключ, пока этот проверял заказ.
+            with patch('foodcartapp.views.store_idempotency_key') as store_key:
+                store_key.return_value = IdempotencyKey.objects.get()
+                replayed_response = self.client.post(
+                    '/api/order/',
+                    self.order_params,
+                    content_type='application/json',
+                    HTTP_IDEMPOTENCY_KEY='checkout-2',
+                )
+            orders, _, _ = drain_journal()
+
+        self.assertEqual(replayed_response.content, response.content)
+        self.assertEqual(len(orders), 1)
+
+    def test_journaled_order_without_products_is_rejected(self):
+        with tempfile.TemporaryDirectory() as journal_dir,\
+                self.settings(ORDER_INTAKE_JOURNAL_DIR=journal_dir):
+            response = self.client.post(
+                '/api/order/',
+                self.order_params,
+                content_type='application/json',
+            )
+            Product.objects.all().delete()
+            orders, broken_count, rejected_count = drain_journal()
+            with open(os.path.join(journal_dir, REJECTED_NAME), 'rb') as rejected_file:
+                rejected_records, _ = decode_records(rejected_file.read())
+
+        self.assertEqual((orders, broken_count, rejected_count), ([], 0, 1))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(
+            [record['intake_id'] for record in rejected_records],
+            [response.json()['intake_id']]
+        )
+
+    def test_bad_journal_record_does_not_block_journal(self):
+        product = Product.objects.get()
+        record = {
+            'registered_at': timezone.now().isoformat(),
+            'firstname': 'Иван',
+            'lastname': None,
+            'phonenumber': '+79161234567',
+            'address': 'Москва',
+            'products': [{'product': product.id, 'price': '100', 'quantity': 1}],
+        }
+        records = [
+            {**record, 'intake_id': str(uuid.uuid4())},
+            {**record, 'intake_id': str(uuid.uuid4()), 'products': record['products'] * 2},
+            {**record, 'intake_id': str(uuid.uuid4())},
+        ]
+        with tempfile.TemporaryDirectory() as journal_dir:
+            for journal_record in records:
+                append_to_journal(journal_record, journal_dir)
+            orders, broken_count, rejected_count = drain_journal(journal_dir)
+            with open(os.path.join(journal_dir, REJECTED_NAME), 'rb') as rejected_file:
+                rejected_records, _ = decode_records(rejected_file.read())
+            segment_names = [
+                name for name in os.listdir(journal_dir) if name.endswith(SEALED_SUFFIX)
+            ]
+
+        self.assertEqual((len(orders), broken_count, rejected_count), (2, 0, 1))
+        self.assertEqual(rejected_records, [records[1]])
+        self.assertEqual(segment_names, [])
+        self.assertCountEqual(
+            [str(order.intake_id) for order in Order.objects.all()],
+            [records[0]['intake_id'], records[2]['intake_id']]
+        )
+
+    def test_fast_path_matches_order_serializer(self):
+        products = Product.objects.in_bulk()
+        orders_params = [
+            self.order_params,
+            {**self.order_params, 'lastname': ''},
+            {**self.order_params, 'firstname': '  Иван  ', 'phonenumber': '8 916 123-45-67'},
+            {key: value for key, value in self.order_params.items() if key != 'lastname'},
+        ]
+        for order_params in orders_params:
+            serializer = OrderSerializer(data=order_params)
+            serializer.is_valid(raise_exception=True)
+            validated_data = validate_order(order_params, products)
+            self.assertEqual(validated_data, serializer.validated_data)
+            self.assertEqual(serialize_order_data(validated_data), serializer.data)
+
+            order = OrderSerializer().create(validated_data)
+            self.assertEqual(
+                JSONRenderer().render(serialize_order(order)),
+                JSONRenderer().render(OrderSerializer(order).data)
+            )
+
+    def test_fast_path_leaves_unusual_orders_to_order_serializer(self):
+        products = Product.objects.in_bulk()
+        product_id = self.order_params['products'][0]['product']
+        orders_params = [
+            {**self.order_params, 'products': [{'product': product_id, 'quantity': '1'}]},
+            {**self.order_params, 'products': [{'product': product_id, 'quantity': 0}]},
+            {**self.order_params, 'phonenumber': '123'},
+            {**self.order_params, 'lastname': None},
+        ]
+        for order_params in orders_params:
+            self.assertIsNone(validate_order(order_params, products))
+
+    def test_fast_path_matches_order_serializer_on_postgresql(self):
+        # Пределы целых чисел PostgreSQL, SQLite их не проверяет.
+        fields = [OrderItem._meta.get_field('quantity'), Product._meta.pk]
+        for field in fields:
+            self.addCleanup(field.__dict__.pop, 'validators', None)
+            field.__dict__.pop('validators', None)
+        with patch.object(
+            connection.ops,
+            'integer_field_range',
+            lambda internal_type: BaseDatabaseOperations.integer_field_ranges[internal_type]
+        ):
+            quantity_validators, product_id_validators = [field.validators for field in fields]
+        products = Product.objects.in_bulk()
+        product_id = self.order_params['products'][0]['product']
+
+        with patch('foodcartapp.fast_serializers.QUANTITY_VALIDATORS', quantity_validators),\
+                patch('foodcartapp.fast_serializers.PRODUCT_ID_VALIDATORS', product_id_validators):
+            for quantity, is_valid in [(2 ** 31 - 1, True), (2 ** 31, False)]:
+                order_params = {
+                    **self.order_params,
+                    'products': [{'product': product_id, 'quantity': quantity}],
+                }
+                serializer = OrderSerializer(data=order_params)
+                self.assertEqual(serializer.is_valid(), is_valid)
+                validated_data = validate_order(order_params, products)
+                if is_valid:
+                    self.assertEqual(validated_data, serializer.validated_data)
+                else:
+                    self.assertIsNone(validated_data)
+                    self.assertEqual(
+                        serializer.errors['products'][0]['quantity'][0].code,
+                        'max_value'
+                    )
+
+            order_params = {
+                **self.order_params,
+                'products': [{'product': 2 ** 31, 'quantity': 1}],
+            }
+            self.assertFalse(OrderSerializer(data=order_params).is_valid())
+            self.assertIsNone(validate_order(order_params, products))
@@ -1,22 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
+from django.utils import timezone
 
-from geopy import distance as dist
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 
+from locations.models import Location
 
-def fetch_coordinates(address, apikey=settings.YANDEX_GEOCODER_KEY):
-    try:
-        base_url = "https://geocode-maps.yandex.ru/1.x"
-        response = requests.get(base_url, params={
-            "geocode": address,
-            "apikey": apikey,
-            "format": "json",
-        })
-        response.raise_for_status()
-        found_places = response.json()['response']['GeoObjectCollection']['featureMember']
-        if not found_places:
-            return None
-    except (requests.exceptions.HTTPError, KeyError):
+
+EARTH_RADIUS = 6371.0088
+WGS84_MAJOR_AXIS = 6378.137
+WGS84_FLATTENING = 1 / 298.257223563
+
+
+geocoder_session = requests.Session()
+geocoder_session.mount(
+    'https://',
+    HTTPAdapter(pool_maxsize=settings.GEOCODER_MAX_WORKERS)
+)
+# Общий на процесс пул запросов к геокодеру: сколько бы заказов ни
+# геокодировалось одновременно, к API идёт не больше GEOCODER_MAX_WORKERS
+# запросов.
+geocoder_executor = ThreadPoolExecutor(
+    max_workers=settings.GEOCODER_MAX_WORKERS,
+    thread_name_prefix='geocoder'
+)
+
+
+def request_coordinates(address, apikey=settings.YANDEX_GEOCODER_KEY):
+    base_url = "https://geocode-maps.yandex.ru/1.x"
+    response = geocoder_session.get(base_url, params={
+        "geocode": address,
+        "apikey": apikey,
+        "format": "json",
+    }, timeout=settings.GEOCODER_TIMEOUT)
+    response.raise_for_status()
+    found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+    if not found_places:
         return None
 
     most_relevant = found_places[0]
@@ -24,6 +46,150 @@ def fetch_coordinates(address, apikey=settings.YANDEX_GEOCODER_KEY):
     return lon, lat
 
 
-def get_distance(from_, to_):
-    distance = dist.distance(from_, to_).km
-    return round(distance)
+def fetch_coordinates(address, apikey=settings.YANDEX_GEOCODER_KEY):
+    # Нужна только миграции 0048, код приложения геокодирует через
+    # lookup_locations.
+    try:
+        return request_coordinates(address, apikey)
+    except (requests.exceptions.RequestException, KeyError):
+        return None
+
+
+def request_coordinates_batch(addresses, apikey=settings.YANDEX_GEOCODER_KEY):
+    # В результат попадают только адреса, на которые геокодер ответил.
+    def request(address):
+        try:
+            return address, request_coordinates(address, apikey)
+        except (requests.exceptions.RequestException, KeyError):
+            return address, False
+
+    addresses = set(addresses)
+    if not addresses:
+        return {}
+    responses = geocoder_executor.map(request, addresses)
+    return {
+        address: coordinates
+        for address, coordinates in responses
+        if coordinates is not False
+    }
+
+
+def normalize_address(address):
+    return ' '.join(address.lower().split())
+
+
+def lookup_locations(addresses, apikey=settings.YANDEX_GEOCODER_KEY):
+    # Адреса, которые геокодер не нашёл, тоже кэшируются: локация без координат.
+    # Ошибки HTTP не кэшируются, чтобы сбой геокодера не «отравил» кэш:
+    # устаревшая локация остаётся в силе до следующей удачной попытки.
+    normalized_addresses = {
+        address: normalize_address(address) for address in addresses
+    }
+    locations = {
+        location.address: location
+        for location in Location.objects.filter(
+            address__in=set(normalized_addresses.values())
+        )
+    }
+
+    missing_addresses = {}
+    for address, normalized_address in normalized_addresses.items():
+        location = locations.get(normalized_address)
+        if not location or location.is_stale():
+            missing_addresses.setdefault(normalized_address, address)
+    found_coordinates = request_coordinates_batch(
+        missing_addresses.values(),
+        apikey
+    )
+    for normalized_address, address in missing_addresses.items():
+        if address not in found_coordinates:
+            continue
+        lon, lat = None, None
+        if found_coordinates[address]:
+            lon, lat = map(float, found_coordinates[address])
+        locations[normalized_address], _ = Location.objects.update_or_create(
+            address=normalized_address,
+            defaults={
+                'lat': lat,
+                'lon': lon,
+                'updated': timezone.now(),
+            }
+        )
+
+    return {
+        address: locations.get(normalized_address)
+        for address, normalized_address in normalized_addresses.items()
+    }
+
+
+def lookup_location(address, apikey=settings.YANDEX_GEOCODER_KEY):
+    return lookup_locations([address], apikey)[address]
+
+
+def get_or_fetch_location(address, apikey=settings.YANDEX_GEOCODER_KEY):
+    location = lookup_location(address, apikey)
+    if not location or not location.is_found():
+        return None
+    return location
+
+
+def calculate_distances(lat1, lon1, lat2, lon2, ellipsoidal=True):
+    # Расстояния в км между точками, координаты в радианах — массивы,
+    # совместимые по правилам broadcasting в NumPy. Без ellipsoidal считается
+    # по сфере (гаверсинус), с ellipsoidal — формула Ламберта для эллипсоида
+    # WGS-84, расхождение с geodesic из geopy в пределах десятков метров.
+    if ellipsoidal:
+        lat1 = np.arctan((1 - WGS84_FLATTENING) * np.tan(lat1))
+        lat2 = np.arctan((1 - WGS84_FLATTENING) * np.tan(lat2))
+
+    haversine = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    central_angle = 2 * np.arcsin(np.sqrt(np.clip(haversine, 0, 1)))
+    if not ellipsoidal:
+        return EARTH_RADIUS * central_angle
+
+    p = (lat1 + lat2) / 2
+    q = (lat2 - lat1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (
+            (central_angle - np.sin(central_angle))
+            * np.sin(p) ** 2 * np.cos(q) ** 2
+            / np.cos(central_angle / 2) ** 2
+        )
+        y = (
+            (central_angle + np.sin(central_angle))
+            * np.cos(p) ** 2 * np.sin(q) ** 2
+            / np.sin(central_angle / 2) ** 2
+        )
+    correction = np.nan_to_num(x + y, nan=0.0, posinf=0.0, neginf=0.0)
+    return WGS84_MAJOR_AXIS * (central_angle - WGS84_FLATTENING / 2 * correction)
+
+
+def get_distance_matrix(origins, destinations, ellipsoidal=True):
+    # Расстояния в км между всеми парами точек (lat, lon):
+    # строки — origins, столбцы — destinations.
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    return calculate_distances(
+        origins[:, 0, np.newaxis],
+        origins[:, 1, np.newaxis],
+        destinations[np.newaxis, :, 0],
+        destinations[np.newaxis, :, 1],
+        ellipsoidal
+    )
+
+
+def get_pairwise_distances(origins, destinations, ellipsoidal=True):
+    # Расстояния в км от каждой точки origins до точки destinations
+    # с тем же номером.
+    origins = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    return calculate_distances(
+        origins[:, 0],
+        origins[:, 1],
+        destinations[:, 0],
+        destinations[:, 1],
+        ellipsoidal
+    )
@@ -1,11 +1,22 @@
-from django.db import transaction
-from django.http import JsonResponse
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
 from django.templatetags.static import static
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+from rest_framework import status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from .models import Product
-from .serializers import OrderSerializer
+from .catalog import COMPACT, PRETTY, get_catalog, get_catalog_changes
+from .fast_serializers import serialize_order, serialize_order_data, validate_order
+from .intake import is_intake_journal_enabled, journal_order
+from .models import IdempotencyKey, Order, Product
+from .serializers import OrderSerializer, create_orders, get_requested_product_ids
 
 
 def banners_list_api(request):
@@ -32,39 +43,211 @@ def banners_list_api(request):
     })
 
 
-def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
+def accepts_gzip(accept_encoding):
+    # gzip;q=0 запрещает сжатие, даже если разрешено «*».
+    encodings = {}
+    for encoding in accept_encoding.split(','):
+        name, *params = [part.strip() for part in encoding.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[name.lower()] = quality
+    return encodings.get('gzip', encodings.get('*', 0)) > 0
+
+
+def get_catalog_response(request):
+    # Каталог достаётся из кэша один раз за запрос: он нужен и для
+    # условного GET, и для тела ответа.
+    if not hasattr(request, 'catalog_response'):
+        catalog = get_catalog()
+        variant = PRETTY if request.GET.get('pretty') else COMPACT
+        use_gzip = accepts_gzip(request.headers.get('Accept-Encoding', ''))
+        catalog_variant = catalog['variants'][variant]
+        request.catalog_response = {
+            'last_modified': catalog['last_modified'],
+            'gzip': use_gzip,
+            'content': catalog_variant['gzip_content' if use_gzip else 'content'],
+            'etag': catalog_variant['gzip_etag' if use_gzip else 'etag'],
+            'token': catalog['token'],
         }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
+    return request.catalog_response
+
+
+@vary_on_headers('Accept-Encoding')
+@condition(
+    etag_func=lambda request: get_catalog_response(request)['etag'],
+    last_modified_func=lambda request: get_catalog_response(request)['last_modified']
+)
+def product_list_api(request):
+    catalog_response = get_catalog_response(request)
+    response = HttpResponse(
+        catalog_response['content'],
+        content_type='application/json'
+    )
+    if catalog_response['gzip']:
+        response['Content-Encoding'] = 'gzip'
+    response['X-Catalog-Token'] = catalog_response['token']
+    return response
+
+
+def product_changes_api(request):
+    try:
+        since = int(request.GET['since'])
+    except ValueError:
+        since = 0
+    return JsonResponse(get_catalog_changes(since), json_dumps_params={
         'ensure_ascii': False,
-        'indent': 4,
     })
 
 
+def product_catalog_api(request):
+    if 'since' in request.GET:
+        return product_changes_api(request)
+    return product_list_api(request)
+
+
+def get_idempotency_key(request):
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        return None
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def replay_response(idempotency_key, request_hash):
+    if idempotency_key.request_hash != request_hash:
+        return Response(
+            {'detail': 'Idempotency-Key has already been used for another request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(idempotency_key.response, status=idempotency_key.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def store_idempotency_key(key, request_hash, status_code, response):
+    # Возвращает ключ параллельного запроса, если тот успел его занять.
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                key=key,
+                request_hash=request_hash,
+                status_code=status_code,
+                response=response,
+            )
+    except IntegrityError:
+        return IdempotencyKey.objects.get(key=key)
+    return None
+
+
 @transaction.atomic
 @api_view(['POST'])
 def register_order(request):
+    # Повтор запроса с тем же Idempotency-Key отдаёт сохранённый ответ, не
+    # разбирая и не проверяя заказ. Сохраняются только успешные ответы:
+    # после ошибки заказ можно отправить снова с тем же ключом.
+    idempotency_key = get_idempotency_key(request)
+    if idempotency_key:
+        request_hash = hashlib.sha256(request.body).hexdigest()
+        stored_key = IdempotencyKey.objects.filter(key=idempotency_key).first()
+        if stored_key and stored_key.is_expired():
+            stored_key.delete()
+        elif stored_key:
+            return replay_response(stored_key, request_hash)
+
     order_params = request.data
-    serializer = OrderSerializer(data=order_params)
-    serializer.is_valid(raise_exception=True)
-    order = serializer.create(serializer.validated_data)
-    return Response(OrderSerializer(order).data)
+    products = Product.objects.in_bulk(get_requested_product_ids(order_params))
+    validated_data = validate_order(order_params, products)
+    if validated_data is None:
+        # Ошибки и непривычные, но допустимые заказы проверяет DRF.
+        serializer = OrderSerializer(data=order_params, context={'products': products})
+        serializer.is_valid(raise_exception=True)
+        validated_data = serializer.validated_data
+
+    if is_intake_journal_enabled():
+        # Заказ попадёт в базу позже, через drain_order_intake.
+        order = None
+        intake_id = uuid.uuid4()
+        response_status = status.HTTP_202_ACCEPTED
+        response_data = {
+            'intake_id': str(intake_id),
+            **serialize_order_data(validated_data),
+        }
+    else:
+        order = OrderSerializer().create(validated_data)
+        response_status = status.HTTP_200_OK
+        response_data = serialize_order(order)
+
+    if idempotency_key:
+        stored_key = store_idempotency_key(
+            idempotency_key, request_hash, response_status, response_data
+        )
+        if stored_key:
+            # Параллельный запрос с тем же ключом успел первым: его заказ
+            # остаётся, этот откатывается.
+            transaction.set_rollback(True)
+            return replay_response(stored_key, request_hash)
+
+    if order:
+        transaction.on_commit(
+            Order.objects.filter(pk=order.pk).geocode_in_background
+        )
+    else:
+        # Запись в журнал отменить нельзя, поэтому она идёт после того, как
+        # занят ключ: проигравший гонку запрос в журнал не попадает. Если
+        # запись не удалась, ключ откатывается вместе с транзакцией.
+        journal_order(validated_data, intake_id)
+    return Response(response_data, status=response_status)
+
+
+@transaction.atomic
+@api_view(['POST'])
+def register_orders_batch(request):
+    # Заказы проверяются по отдельности, но с общими товарами, а записываются
+    # вместе. Ответ — результат по каждому заказу в порядке запроса.
+    orders_params = request.data
+    if not isinstance(orders_params, list):
+        raise ValidationError({'non_field_errors': ['Expected a list of orders.']})
+    if len(orders_params) > settings.ORDER_BATCH_MAX_SIZE:
+        raise ValidationError({
+            'non_field_errors': [
+                f'Ensure this batch has no more than {settings.ORDER_BATCH_MAX_SIZE} orders.'
+            ]
+        })
+
+    product_ids = set()
+    for order_params in orders_params:
+        product_ids |= get_requested_product_ids(order_params)
+    context = {'products': Product.objects.in_bulk(product_ids)}
+
+    # Один сериализатор на всю пачку: DRF строит поля сериализатора
+    # при первом обращении, и это дороже проверки самого заказа.
+    serializer = OrderSerializer(context=context)
+    results = []
+    orders_data = []
+    for order_params in orders_params:
+        try:
+            orders_data.append(
+                validate_order(order_params, context['products'])
+                or serializer.run_validation(order_params)
+            )
+            results.append(None)
+        except ValidationError as error:
+            results.append({'status': 'error', 'errors': error.detail})
+
+    orders = create_orders(orders_data)
+    created_orders = iter(orders)
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = {'status': 'created', 'order': serialize_order(next(created_orders))}
+
+    order_ids = [order.id for order in orders]
+    if order_ids:
+        transaction.on_commit(
+            Order.objects.filter(pk__in=order_ids).geocode_in_background
+        )
+    return Response(results)
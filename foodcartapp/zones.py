@@ -0,0 +1,139 @@
+import math
+import time
+from collections import defaultdict
+from threading import Lock
+
+import numpy as np
+
+from .models import DeliveryZone, Order, Restaurant
+
+
+INDEX_TTL = 60
+GRID_CELL_DEGREES = 0.02
+MAX_ZONE_CELLS = 2500
+
+
+def get_cell(lat, lon):
+    return math.floor(lat / GRID_CELL_DEGREES), math.floor(lon / GRID_CELL_DEGREES)
+
+
+def contains_point(polygon, lat, lon):
+    # Луч из точки на восток пересекает границу многоугольника нечётное число
+    # раз, если точка внутри.
+    lats, lons = polygon[:, 0], polygon[:, 1]
+    next_lats, next_lons = np.roll(lats, -1), np.roll(lons, -1)
+    crosses = (lats > lat) != (next_lats > lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_lons = lons + (lat - lats) * (next_lons - lons) / (next_lats - lats)
+    return bool(np.count_nonzero(crosses & (lon < crossing_lons)) % 2)
+
+
+class ZoneIndex:
+    # Сетка по описанным прямоугольникам зон доставки: точку проверяют только
+    # на попадание в зоны, чьи прямоугольники задевают её ячейку. Зоны,
+    # которые заняли бы больше MAX_ZONE_CELLS ячеек, в сетку не попадают
+    # и проверяются для каждой точки. Рестораны без зон доставляют куда
+    # угодно.
+    def __init__(self, zones, unrestricted_restaurant_ids=()):
+        self.restaurant_ids = []
+        self.polygons = []
+        self.bboxes = []
+        self.cells = defaultdict(list)
+        self.large_zone_indices = []
+        self.unrestricted_restaurant_ids = set(unrestricted_restaurant_ids)
+        for restaurant_id, polygon in zones:
+            try:
+                polygon = np.asarray(polygon, dtype=float)
+            except (TypeError, ValueError):
+                continue
+            if polygon.ndim != 2 or polygon.shape[1] != 2 or len(polygon) < 3:
+                continue
+            (south, west), (north, east) = polygon.min(axis=0), polygon.max(axis=0)
+            zone_index = len(self.polygons)
+            self.restaurant_ids.append(restaurant_id)
+            self.polygons.append(polygon)
+            self.bboxes.append((south, west, north, east))
+            (south_row, west_column), (north_row, east_column) = get_cell(south, west), get_cell(north, east)
+            cells_count = (north_row - south_row + 1) * (east_column - west_column + 1)
+            if cells_count > MAX_ZONE_CELLS:
+                self.large_zone_indices.append(zone_index)
+                continue
+            for row in range(south_row, north_row + 1):
+                for column in range(west_column, east_column + 1):
+                    self.cells[row, column].append(zone_index)
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls):
+        return cls(
+            DeliveryZone.objects.values_list('restaurant_id', 'polygon'),
+            Restaurant.objects.filter(delivery_zones__isnull=True).values_list('id', flat=True)
+        )
+
+    def is_expired(self):
+        return time.monotonic() - self.built_at > INDEX_TTL
+
+    def is_empty(self):
+        return not self.polygons
+
+    def get_restaurant_ids(self, lat, lon):
+        restaurant_ids = set(self.unrestricted_restaurant_ids)
+        zone_indices = [*self.cells.get(get_cell(lat, lon), []), *self.large_zone_indices]
+        for zone_index in zone_indices:
+            restaurant_id = self.restaurant_ids[zone_index]
+            if restaurant_id in restaurant_ids:
+                continue
+            south, west, north, east = self.bboxes[zone_index]
+            if not (south <= lat <= north and west <= lon <= east):
+                continue
+            if contains_point(self.polygons[zone_index], lat, lon):
+                restaurant_ids.add(restaurant_id)
+        return restaurant_ids
+
+
+zone_index = None
+zone_index_lock = Lock()
+
+
+def get_zone_index():
+    # Как и остальные индексы, живёт в памяти процесса и сбрасывается сигналами
+    # этого процесса сразу, а изменения из других процессов видит по INDEX_TTL.
+    global zone_index
+    with zone_index_lock:
+        if not zone_index or zone_index.is_expired():
+            zone_index = ZoneIndex.build()
+        return zone_index
+
+
+def reset_zone_index():
+    global zone_index
+    with zone_index_lock:
+        zone_index = None
+
+
+def is_deliverable(location):
+    # None — проверить нельзя: координаты неизвестны или зоны не заведены.
+    zone_index = get_zone_index()
+    if zone_index.is_empty() or not location or not location.is_found():
+        return None
+    return bool(zone_index.get_restaurant_ids(location.lat, location.lon))
+
+
+def attach_delivery_restaurants(orders):
+    zone_index = get_zone_index()
+    DeliveryRestaurant = Order.delivery_restaurants.through
+    DeliveryRestaurant.objects.filter(order_id__in=[order.id for order in orders]).delete()
+
+    delivery_restaurants = []
+    for order in orders:
+        order.in_delivery_zone = None
+        if zone_index.is_empty() or not order.location:
+            continue
+        restaurant_ids = zone_index.get_restaurant_ids(order.location.lat, order.location.lon)
+        order.in_delivery_zone = bool(restaurant_ids)
+        delivery_restaurants.extend(
+            DeliveryRestaurant(order_id=order.id, restaurant_id=restaurant_id)
+            for restaurant_id in restaurant_ids
+        )
+    DeliveryRestaurant.objects.bulk_create(delivery_restaurants)
+    Order.objects.bulk_update(orders, ['in_delivery_zone'])
@@ -0,0 +1,59 @@
+import math
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_PRECISION = 12
+KM_PER_DEGREE = 111.32
+
+
+def encode(lat, lon, precision=MAX_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits, bits_count, is_lon = 0, 0, True
+    while len(geohash) < precision:
+        value, value_range = (lon, lon_range) if is_lon else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits << 1 | 1
+            value_range[0] = middle
+        else:
+            bits = bits << 1
+            value_range[1] = middle
+        is_lon = not is_lon
+        bits_count += 1
+        if bits_count == 5:
+            geohash.append(BASE32[bits])
+            bits, bits_count = 0, 0
+    return ''.join(geohash)
+
+
+def get_cell_size(precision):
+    # Высота и ширина ячейки в градусах.
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def get_precision(lat, distance):
+    # Самая мелкая ячейка, которая не уже заданного расстояния: точка и все
+    # места в пределах distance км от неё попадают в ячейку точки или соседние.
+    for precision in range(MAX_PRECISION, 0, -1):
+        height, width = get_cell_size(precision)
+        height_km = height * KM_PER_DEGREE
+        width_km = width * KM_PER_DEGREE * math.cos(math.radians(lat))
+        if min(height_km, width_km) >= distance:
+            return precision
+    return 1
+
+
+def get_neighbourhood(lat, lon, precision):
+    height, width = get_cell_size(precision)
+    geohashes = set()
+    for lat_shift in (-height, 0, height):
+        neighbour_lat = lat + lat_shift
+        if not -90 <= neighbour_lat <= 90:
+            continue
+        for lon_shift in (-width, 0, width):
+            neighbour_lon = (lon + lon_shift + 180) % 360 - 180
+            geohashes.add(encode(neighbour_lat, neighbour_lon, precision))
+    return geohashes
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.15 on 2026-10-18 02:49
+
+from django.db import migrations, models
+
+
+def normalize_addresses(apps, schema_editor):
+    # Адрес становится ключом кэша геокодера: адреса приводятся к виду
+    # normalize_address, а из локаций с одинаковым адресом остаётся самая
+    # свежая, рестораны переносятся на неё.
+    Location = apps.get_model('locations', 'Location')
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    kept_locations = {}
+    for location in Location.objects.order_by('-updated', '-id').iterator():
+        address = ' '.join(location.address.lower().split())
+        kept_location = kept_locations.get(address)
+        if kept_location:
+            Restaurant.objects.filter(coordinates=location).update(coordinates=kept_location)
+            location.delete()
+            continue
+        kept_locations[address] = location
+        if location.address != address:
+            location.address = address
+            location.save(update_fields=['address'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0002_alter_location_unique_together'),
+        ('foodcartapp', '0050_rename_registrated_at_order_registered_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='location',
+            name='address',
+            field=models.TextField(verbose_name='адрес'),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='lat',
+            field=models.FloatField(blank=True, null=True, verbose_name='широта'),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='lon',
+            field=models.FloatField(blank=True, null=True, verbose_name='долгота'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='location',
+            unique_together=set(),
+        ),
+        migrations.RunPython(normalize_addresses, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='location',
+            name='address',
+            field=models.TextField(unique=True, verbose_name='адрес'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.15 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+from locations.geohash import encode
+
+
+def fill_geohashes(apps, schema_editor):
+    Location = apps.get_model('locations', 'Location')
+
+    locations = Location.objects.filter(lat__isnull=False, lon__isnull=False)
+    for location in locations.iterator():
+        location.geohash = encode(location.lat, location.lon)
+        location.save(update_fields=['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0003_location_geocoder_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, verbose_name='геохэш'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['lat', 'lon'], name='locations_l_lat_657888_idx'),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+    ]
@@ -1,19 +1,61 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 
+from .geohash import KM_PER_DEGREE, MAX_PRECISION, encode, get_neighbourhood, get_precision
+
+
+def get_expiration_date():
+    return timezone.now() - timedelta(days=settings.GEOCODER_CACHE_DAYS)
+
+
+class LocationQuerySet(models.QuerySet):
+    def fresh(self):
+        return self.filter(updated__gte=get_expiration_date())
+
+    def within_bbox(self, south, west, north, east):
+        locations = self.filter(lat__range=(south, north))
+        if west <= east:
+            return locations.filter(lon__range=(west, east))
+        return locations.filter(Q(lon__gte=west) | Q(lon__lte=east))
+
+    def in_neighbourhood(self, lat, lon, precision):
+        geohash_filter = Q()
+        for neighbour in get_neighbourhood(lat, lon, precision):
+            geohash_filter |= Q(geohash__startswith=neighbour)
+        return self.filter(geohash_filter)
+
+    def around(self, lat, lon, distance):
+        # Геохэш и прямоугольник только отсекают заведомо далёкие локации,
+        # точное расстояние до оставшихся нужно считать отдельно.
+        precision = get_precision(lat, distance)
+        lat_delta = distance / KM_PER_DEGREE
+        lon_delta = lat_delta / max(math.cos(math.radians(lat)), 0.01)
+        return self.in_neighbourhood(lat, lon, precision).within_bbox(
+            lat - lat_delta,
+            (lon - lon_delta + 180) % 360 - 180,
+            lat + lat_delta,
+            (lon + lon_delta + 180) % 360 - 180,
+        )
+
 
 class Location(models.Model):
-    address = models.CharField(
+    address = models.TextField(
         'адрес',
-        max_length=100,
-        blank=True,
+        unique=True,
     )
     lat = models.FloatField(
         'широта',
+        null=True,
         blank=True,
     )
     lon = models.FloatField(
         'долгота',
+        null=True,
         blank=True,
     )
     updated = models.DateTimeField(
@@ -21,16 +63,86 @@ class Location(models.Model):
         default=timezone.now,
         db_index=True
     )
+    geohash = models.CharField(
+        'геохэш',
+        max_length=MAX_PRECISION,
+        blank=True,
+        db_index=True,
+    )
+
+    objects = LocationQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'локация'
         verbose_name_plural = 'локации'
-        unique_together = [
-            ['lat', 'lon']
+        indexes = [
+            models.Index(fields=['lat', 'lon']),
         ]
 
     def __str__(self):
         return f'({self.lat}, {self.lon})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        location = super().from_db(db, field_names, values)
+        if {'lat', 'lon'} <= set(field_names):
+            location.saved_coordinates = location.get_coordinates()
+        return location
+
+    def save(self, *args, **kwargs):
+        self.geohash = encode(float(self.lat), float(self.lon)) if self.is_found() else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields and {'lat', 'lon'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        # Сохранённые расстояния устаревают, только если локацию передвинули.
+        # Локация, загруженная без координат (only/defer), считается
+        # передвинутой.
+        is_moved = (
+            not self._state.adding
+            and getattr(self, 'saved_coordinates', None) != self.get_coordinates()
+        )
+        # Флаг читают обработчики post_save.
+        self.is_moved = is_moved
+        super().save(*args, **kwargs)
+        self.saved_coordinates = self.get_coordinates()
+        if is_moved and settings.DISTANCE_CACHE_PERSISTENT:
+            LocationDistance.objects.filter(
+                Q(origin=self) | Q(destination=self)
+            ).delete()
+
+    def is_stale(self):
+        return self.updated < get_expiration_date()
+
     def get_coordinates(self):
         return self.lat, self.lon
+
+    def is_found(self):
+        return self.lat is not None and self.lon is not None
+
+
+class LocationDistance(models.Model):
+    origin = models.ForeignKey(
+        Location,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='откуда',
+    )
+    destination = models.ForeignKey(
+        Location,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='куда',
+    )
+    distance = models.FloatField(
+        'расстояние, км'
+    )
+
+    class Meta:
+        verbose_name = 'расстояние между локациями'
+        verbose_name_plural = 'расстояния между локациями'
+        unique_together = [
+            ['origin', 'destination']
+        ]
+
+    def __str__(self):
+        return f'{self.origin} - {self.destination}: {self.distance} км'
@@ -1,15 +1,28 @@
-from functools import reduce
+import json
+import time
+from datetime import datetime, timedelta
 
 from django import forms
+from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.views import View
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 
-from foodcartapp.models import Product, Restaurant, Order
-from foodcartapp.utils import fetch_coordinates, get_distance
+from foodcartapp.availability import get_stored_orders_candidates
+from foodcartapp.models import Product, Restaurant, Order, OrderChange
+from foodcartapp.routes import get_delivery_routes
+
+
+ORDERS_PAGE_SIZE = 50
+ORDER_EVENTS_SLOT_KEY = 'order-events:slot:{slot}'
 
 
 class Login(forms.Form):
@@ -91,36 +104,223 @@ def view_restaurants(request):
     })
 
 
+class OrderFilters(forms.Form):
+    status = forms.ChoiceField(
+        label='Статус', required=False,
+        choices=[
+            ('', 'Все необработанные'),
+            *[(status, name) for status, name in Order.STATUSES if status in Order.ACTIVE_STATUSES]
+        ],
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    payment_method = forms.ChoiceField(
+        label='Способ оплаты', required=False,
+        choices=[('', 'Любой'), *Order.PAYMENT_METHODS],
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    restaurant = forms.ModelChoiceField(
+        label='Ресторан', required=False,
+        queryset=Restaurant.objects.order_by('name'),
+        empty_label='Любой',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+
+def parse_order_cursor(cursor):
+    try:
+        registered_at, order_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(registered_at), int(order_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def format_order_cursor(order):
+    return f'{order.registered_at.isoformat()}_{order.id}'
+
+
+def get_orders_page(orders, after=None, before=None):
+    # Пагинация по ключу (registered_at, id): страница ищется по индексу,
+    # без OFFSET, и не «съезжает», когда приходят новые заказы.
+    if before:
+        registered_at, order_id = before
+        orders = orders.filter(
+            Q(registered_at__lt=registered_at)
+            | Q(registered_at=registered_at, id__lt=order_id)
+        ).order_by('-registered_at', '-id')
+        page = list(orders[:ORDERS_PAGE_SIZE + 1])
+        has_previous = len(page) > ORDERS_PAGE_SIZE
+        return page[:ORDERS_PAGE_SIZE][::-1], has_previous, True
+
+    if after:
+        registered_at, order_id = after
+        orders = orders.filter(
+            Q(registered_at__gt=registered_at)
+            | Q(registered_at=registered_at, id__gt=order_id)
+        )
+    page = list(orders.order_by('registered_at', 'id')[:ORDERS_PAGE_SIZE + 1])
+    has_next = len(page) > ORDERS_PAGE_SIZE
+    return page[:ORDERS_PAGE_SIZE], bool(after), has_next
+
+
+def filter_active_orders(params):
+    filters = OrderFilters(params)
+    active_orders = Order.objects.filter(status__in=Order.ACTIVE_STATUSES)\
+                                 .select_related('location', 'restaurant')
+    if filters.is_valid():
+        if filters.cleaned_data['status']:
+            active_orders = active_orders.filter(status=filters.cleaned_data['status'])
+        if filters.cleaned_data['payment_method']:
+            active_orders = active_orders.filter(
+                payment_method=filters.cleaned_data['payment_method']
+            )
+        if filters.cleaned_data['restaurant']:
+            active_orders = active_orders.filter(restaurant=filters.cleaned_data['restaurant'])
+    return filters, active_orders
+
+
+def add_orders_candidates(orders):
+    orders_candidates = get_stored_orders_candidates(orders)
+    for order in orders:
+        order.restaurants = orders_candidates[order.id]
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
-    active_orders = Order.objects.exclude(status=Order.RECEIVED)\
-                                 .fetch_with_cost()\
-                                 .prefetch_related('products')
-    for order in active_orders:
-        products = [product for product in order.products.all()]
-        order_restaurants = get_available_restaurants(products)
-        order_coordinates = fetch_coordinates(order.address)
-        if order_coordinates:
-            for restaurant in order_restaurants:
-                restaurant.distance = get_distance(
-                    restaurant.coordinates.get_coordinates(),
-                    order_coordinates
-                )
-            order.restaurants = order_restaurants
+    # Изменения, случившиеся после этого id, страница получит через поток событий.
+    last_change_id = OrderChange.objects.get_latest_id()
+    filters, active_orders = filter_active_orders(request.GET)
+    page, has_previous, has_next = get_orders_page(
+        active_orders,
+        after=parse_order_cursor(request.GET.get('after')),
+        before=parse_order_cursor(request.GET.get('before')),
+    )
+    add_orders_candidates(page)
+
+    filters_params = request.GET.copy()
+    filters_params.pop('after', None)
+    filters_params.pop('before', None)
+    previous_page_params, next_page_params = None, None
+    if page and has_previous:
+        previous_page_params = filters_params.copy()
+        previous_page_params['before'] = format_order_cursor(page[0])
+        previous_page_params = previous_page_params.urlencode()
+    if page and has_next:
+        next_page_params = filters_params.copy()
+        next_page_params['after'] = format_order_cursor(page[-1])
+        next_page_params = next_page_params.urlencode()
+
     return render(request, template_name='order_items.html', context={
-        'order_items': active_orders
+        'order_items': page,
+        'filters': filters,
+        'filters_params': filters_params.urlencode(),
+        'previous_page_params': previous_page_params,
+        'next_page_params': next_page_params,
+        'last_change_id': last_change_id,
+        'page_path': request.get_full_path(),
     })
 
 
-def get_available_restaurants(products):
-    products_ids = [product.id for product in products]
-    products = Product.objects.filter(id__in=products_ids)\
-                              .prefetch_related('menu_items')
-    availability = []
-    for product in products:
-        available_restaurants = set()
-        for item in product.menu_items.all():
-            if item.availability:
-                available_restaurants.add(item.restaurant)
-        availability.append(available_restaurants)
-    return reduce(set.intersection, availability)
+def format_order_event(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+
+def stream_order_events(params, last_change_id):
+    # Поток опрашивает только журнал изменений заказов, а строки таблицы
+    # рендерит лишь для изменившихся заказов. Через ORDER_EVENTS_STREAM_SECONDS
+    # поток закрывается, и браузер переподключается с заголовком Last-Event-ID.
+    # У каждого события свой id — последнее изменение заказа, поэтому
+    # оборванный посреди пачки поток продолжится с первого неотправленного.
+    yield f'retry: {int(settings.ORDER_EVENTS_POLL_SECONDS * 1000)}\n\n'
+    page_path = reverse('restaurateur:view_orders')
+    deadline = time.monotonic() + settings.ORDER_EVENTS_STREAM_SECONDS
+    # Журнал перечитывается с запасом в CHANGE_LOG_REREAD_SECONDS, а уже
+    # отправленные за это время изменения пропускаются.
+    sent_changes = {}
+    while time.monotonic() < deadline:
+        reread_since = timezone.now() - timedelta(seconds=settings.CHANGE_LOG_REREAD_SECONDS)
+        sent_changes = {
+            change_id: changed_at
+            for change_id, changed_at in sent_changes.items()
+            if changed_at >= reread_since
+        }
+        changes = list(
+            OrderChange.objects.after(last_change_id)
+                               .exclude(id__in=sent_changes)
+                               .order_by('id')
+                               .values_list('id', 'order_id', 'changed_at')[:ORDERS_PAGE_SIZE]
+        )
+        if not changes:
+            time.sleep(settings.ORDER_EVENTS_POLL_SECONDS)
+            continue
+
+        orders_change_ids = {}
+        for change_id, order_id, changed_at in changes:
+            sent_changes[change_id] = changed_at
+            orders_change_ids[order_id] = change_id
+        last_change_id = max(last_change_id, changes[-1][0])
+        _, active_orders = filter_active_orders(params)
+        orders = {
+            order.id: order
+            for order in active_orders.filter(id__in=orders_change_ids)
+        }
+        add_orders_candidates(list(orders.values()))
+        for order_id, change_id in sorted(orders_change_ids.items(), key=lambda item: item[1]):
+            if order_id not in orders:
+                yield format_order_event(change_id, 'remove', {'id': order_id})
+                continue
+            yield format_order_event(change_id, 'upsert', {
+                'id': order_id,
+                'html': render_to_string('order_row.html', {
+                    'item': orders[order_id],
+                    'page_path': page_path,
+                }),
+            })
+
+
+def acquire_order_events_slot():
+    # Открытый поток занимает воркер, поэтому одновременных потоков не больше
+    # ORDER_EVENTS_MAX_STREAMS. Место освобождается при закрытии потока, а
+    # если процесс упал — само, по таймауту ключа в кэше.
+    for slot in range(settings.ORDER_EVENTS_MAX_STREAMS):
+        slot_key = ORDER_EVENTS_SLOT_KEY.format(slot=slot)
+        if cache.add(slot_key, True, settings.ORDER_EVENTS_STREAM_SECONDS * 2):
+            return slot_key
+    return None
+
+
+def hold_order_events_slot(events, slot_key):
+    try:
+        yield from events
+    finally:
+        cache.delete(slot_key)
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_order_events(request):
+    try:
+        last_change_id = int(
+            request.headers.get('Last-Event-ID') or request.GET.get('last_change_id')
+        )
+    except (TypeError, ValueError):
+        last_change_id = OrderChange.objects.get_latest_id()
+    slot_key = acquire_order_events_slot()
+    if slot_key:
+        events = hold_order_events_slot(
+            stream_order_events(request.GET, last_change_id),
+            slot_key
+        )
+    else:
+        # Мест нет: браузер переподключится позже с тем же Last-Event-ID.
+        events = [f'retry: {int(settings.ORDER_EVENTS_STREAM_SECONDS * 1000)}\n\n']
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_routes(request):
+    return render(request, template_name='routes.html', context={
+        'routes': get_delivery_routes(),
+        'stops_count': settings.ROUTE_STOPS,
+    })
@@ -12,6 +12,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 POSTGRES_DB_URL = env.str('POSTGRES_DB_URL')
 YANDEX_GEOCODER_KEY = env('YANDEX_GEOCODER_KEY')
+GEOCODER_CACHE_DAYS = env.int('GEOCODER_CACHE_DAYS', 30)
+GEOCODER_TIMEOUT = env.float('GEOCODER_TIMEOUT', 5)
+GEOCODER_MAX_WORKERS = env.int('GEOCODER_MAX_WORKERS', 8)
 
 SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', False)
@@ -90,6 +93,25 @@ DATABASES = {
     )
 }
 
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://')
+}
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', 300)
+CHANGE_LOG_REREAD_SECONDS = env.int('CHANGE_LOG_REREAD_SECONDS', 60)
+CHANGE_LOG_RETENTION_DAYS = env.int('CHANGE_LOG_RETENTION_DAYS', 7)
+DISTANCE_CACHE_SIZE = env.int('DISTANCE_CACHE_SIZE', 100000)
+DISTANCE_CACHE_PERSISTENT = env.bool('DISTANCE_CACHE_PERSISTENT', False)
+ORDER_EVENTS_STREAM_SECONDS = env.int('ORDER_EVENTS_STREAM_SECONDS', 25)
+ORDER_EVENTS_POLL_SECONDS = env.float('ORDER_EVENTS_POLL_SECONDS', 2)
+ORDER_EVENTS_MAX_STREAMS = env.int('ORDER_EVENTS_MAX_STREAMS', 4)
+RESTAURANT_LOAD_WEIGHT = env.float('RESTAURANT_LOAD_WEIGHT', 3)
+ORDER_CANDIDATES_COUNT = env.int('ORDER_CANDIDATES_COUNT', 10)
+REJECT_UNDELIVERABLE_ORDERS = env.bool('REJECT_UNDELIVERABLE_ORDERS', False)
+ROUTE_STOPS = env.int('ROUTE_STOPS', 4)
+IDEMPOTENCY_KEY_TTL_HOURS = env.int('IDEMPOTENCY_KEY_TTL_HOURS', 24)
+ORDER_BATCH_MAX_SIZE = env.int('ORDER_BATCH_MAX_SIZE', 500)
+ORDER_INTAKE_JOURNAL_DIR = env.str('ORDER_INTAKE_JOURNAL_DIR', '')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',